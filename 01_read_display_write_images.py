@@ -1,6 +1,10 @@
+import os
+
 import numpy as np
 import cv2 as cv
 
+from bulk_io import BulkReader, BulkWriter, list_images
+
 # Loads a color image. 
 # Any transparency of image will be neglected. It is the default flag
 # variant flags: (cv.IMREAD_GRAYSCALE, cv.IMREAD_UNCHANGED -> for alpha channel)
@@ -29,3 +33,14 @@ cv.waitKey(0)
 # use the function cv.destroyWindow(window_name)
 cv.destroyAllWindows()
 
+
+# Reading and writing many images
+# cv.imread and cv.imwrite work on one file at a time, and they spend most of it decoding / encoding on one core.
+# bulk_io.py runs them in a pool of threads (OpenCV releases the GIL while it works), reads ahead of the loop,
+# and bounds the memory used by the images in flight. Here every image of the current directory is saved as PNG:
+os.makedirs('png', exist_ok=True)
+with BulkWriter() as writer:
+    for path, img in BulkReader(list_images('.'), prefetch=16):
+        if img is not None:
+            writer.write(os.path.join('png', os.path.splitext(os.path.basename(path))[0] + '.png'), img)
+print("could not write:", writer.failed)
@@ -2,16 +2,20 @@ import numpy as np
 import cv2 as cv
 import matplotlib.pyplot as plt
 
+import channels
+
 # Loads a color image. 
 # Any transparency of image will be neglected. It is the default flag
 # variant flags: (cv.IMREAD_GRAYSCALE, cv.IMREAD_UNCHANGED -> for alpha channel)
 img_bgr = cv.imread('lena30.jpg', cv.IMREAD_COLOR) # image loaded in BGR order
 
 # split 3 color channels
-b, g, r = cv.split(img_bgr)
+# (channels.split returns views of the channels instead of copying them like cv.split, see channels.py)
+b, g, r = channels.split(img_bgr)
 
 # merge in the right order for RGB image
-img_rgb = cv.merge([r, g, b])
+# the channels are views of img_bgr, so the result is a view as well: img_bgr[:, :, ::-1], nothing is copied
+img_rgb = channels.merge([r, g, b])
 
 # two more ways to convert image from BGR to RGB
 # first:
@@ -29,7 +33,10 @@ plt.show()
 
 # show using opencv
 cv.imshow('bgr image', img_bgr) # expects true color
-cv.imshow('rgb image', img_rgb) # expects distorted color
+# OpenCV can't use a view with a negative stride directly, so it has to be copied first.
+# for_opencv makes the copy visible: it is recorded in channels.copy_log
+cv.imshow('rgb image', channels.for_opencv(img_rgb, 'imshow')) # expects distorted color
+print(channels.copy_log.summary())
 
 # wait until a key is pressed and returns the pressed key
 # we pass 0 to wait indefinitely and we have no interest in the key pressed
@@ -1,6 +1,11 @@
+import threading
+from collections import deque
+
 import numpy as np
 import cv2 as cv
 
+from motion_gate import MotionGate
+
 # create VideoCapture object with the built-in webcam (index: 0)
 # Its argument can be either the device index or the name of a video file
 cap = cv.VideoCapture(0)
@@ -16,14 +21,139 @@ if cap.isOpened() == False:
 
 # Some of these values can be modified using cap.set(propId, value)
 
+
+######## Grabbing frames on a background thread ########
+
+# cap.read() is just cap.grab() (take the frame from the camera) followed by cap.retrieve() (decode it).
+# If we call it inside the display loop, every slow step after it (cvtColor, imshow, ...) delays the next grab,
+# and the frames keep piling up inside the camera driver. What we see on screen gets older and older.
+
+# Instead, a background thread keeps grabbing and writes the frames into a fixed ring of preallocated buffers.
+# The loop then simply asks for a frame. There are two policies when the loop is slower than the camera:
+# 	- 'latest'      : only the newest frame is kept, older unread frames are dropped (lowest latency)
+# 	- 'drop_oldest' : unread frames are queued in the ring, when it is full the oldest one is dropped
+# In both cases the number of dropped frames is counted, so nothing grows without bounds.
+
+class FrameGrabber:
+    def __init__(self, cap, num_buffers=4, policy='latest'):
+        if policy not in ('latest', 'drop_oldest'):
+            raise ValueError("policy must be 'latest' or 'drop_oldest'")
+
+        # we need at least one slot for the reader, one for the grabber and one ready frame
+        if num_buffers < 3:
+            raise ValueError("num_buffers must be at least 3")
+
+        self.cap = cap
+        self.policy = policy
+        self.dropped = 0
+        self.grabbed = 0
+
+        # read a first frame to know the frame size, then preallocate the ring
+        ret, frame = cap.read()
+        if ret == False:
+            raise RuntimeError("could not read a frame from the capture")
+        self.buffers = [np.empty_like(frame) for i in range(num_buffers)]
+
+        self.free = deque(range(num_buffers)) # slots nobody is using
+        self.ready = deque()                  # slots holding frames not read yet (oldest first)
+        self.current = None                   # slot handed to the reader by the last read()
+
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def _take_slot(self):
+        # called with the lock held, returns a slot the grabber can write into
+        # with 'latest' there is always a free slot (one for the reader, one ready frame, one being decoded),
+        # so the ready frame stays available to read() while the new one is decoded
+        if not self.free:
+            # ring is full, drop the oldest unread frame
+            self.free.append(self.ready.popleft())
+            self.dropped += 1
+        return self.free.popleft()
+
+    def _run(self):
+        while self.running:
+            if not self.cap.grab():
+                break
+
+            with self.cond:
+                slot = self._take_slot()
+
+            # decode outside the lock, directly into the preallocated buffer
+            ret, frame = self.cap.retrieve(self.buffers[slot])
+
+            with self.cond:
+                if ret == False:
+                    self.free.append(slot)
+                    continue
+                if frame is not self.buffers[slot]:
+                    # the frame size changed, so OpenCV had to allocate a new array: adopt it
+                    self.buffers[slot] = frame
+                if self.policy == 'latest':
+                    # the new frame makes the unread ones stale, only now that it is decoded
+                    while self.ready:
+                        self.free.append(self.ready.popleft())
+                        self.dropped += 1
+                self.ready.append(slot)
+                self.grabbed += 1
+                self.cond.notify()
+
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+    def read(self, timeout=1.0):
+        # same return values as cap.read()
+        # Note: the frame is a view into the ring, it stays valid only until the next read()
+        with self.cond:
+            if self.current is not None:
+                self.free.append(self.current)
+                self.current = None
+
+            if not self.cond.wait_for(lambda: self.ready or not self.running, timeout):
+                return False, None
+            if not self.ready:
+                return False, None
+
+            if self.policy == 'latest':
+                self.current = self.ready.pop()
+            else:
+                self.current = self.ready.popleft()
+            return True, self.buffers[self.current]
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+######## Skipping frames that didn't change ########
+
+# MotionGate (see motion_gate.py) reuses the last outputs of the stage when nothing moved in the frame.
+
+def process(frame):
+    # Our operations on the frame come here -> convert to grayscale
+    return cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+
+
+grabber = FrameGrabber(cap, num_buffers=4, policy='latest').start()
+gate = MotionGate()
+
 while(True):
     # Capture frame-by-frame
     # returns a bool (True/False). True If frame is read correctly
-    ret, frame = cap.read()
+    ret, frame = grabber.read()
 
     if ret == True:
-        # Our operations on the frame come here -> convert to grayscale
-        gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+        gray = gate.run(frame, process)
 
         # Display the resulting frame
         cv.imshow('frame', gray)
@@ -32,6 +162,10 @@ while(True):
     if cv.waitKey(1) & 0xFF == ord('q'):
         break
 
-# When everything done, release the capture
+print("frames grabbed: %d, frames dropped: %d" % (grabber.grabbed, grabber.dropped))
+print("unchanged frames skipped: %.1f%%" % (100 * gate.hit_rate()))
+
+# When everything done, stop the grabber and release the capture
+grabber.stop()
 cap.release()
-cv.destroyAllWindows()
\ No newline at end of file
+cv.destroyAllWindows()
@@ -1,38 +1,200 @@
+import sys
+import multiprocessing as mp
+
 import numpy as np
 import cv2 as cv
 
-# create VideoCapture object with movieFile
-# Its argument can be either the device index or the name of a video file
-cap = cv.VideoCapture('bird.avi')
+from motion_gate import MotionGate
+
+######## Reading frames in preallocated batches ########
+
+# In a simple loop, every cap.read() and cv.cvtColor() call allocates a brand new array for its result.
+# Over thousands of files this allocation churn adds up. Both functions accept a destination array,
+# so we can allocate a stack of N frames (and N grayscale images) once and keep decoding into it.
+# Every call to read_batch() fills the stacks and returns how many frames are valid,
+# which also lets later stages work on a whole (n, H, W) batch at once with numpy.
+
+class BatchReader:
+    def __init__(self, cap, batch_size=16):
+        self.cap = cap
+        self.batch_size = batch_size
+        self.pending = None # frame read with another size than the stacks, first frame of the next batch
+        width = int(cap.get(cv.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv.CAP_PROP_FRAME_HEIGHT))
+        self.allocate((height, width, 3))
+
+    def allocate(self, shape):
+        self.frames = np.empty((self.batch_size,) + shape, np.uint8)
+        self.grays = np.empty((self.batch_size,) + shape[:2], np.uint8)
+
+    def read_batch(self):
+        # returns n, frames[:n], grays[:n]
+        # Note: the batches are views into the stacks, they are overwritten by the next read_batch()
+        n = 0
+        while n < len(self.frames):
+            dst = self.frames[n]
+            if self.pending is not None:
+                frame, self.pending = self.pending, None
+            else:
+                ret, frame = self.cap.read(dst)
+                if ret == False:
+                    break
+            if frame is not dst:
+                # OpenCV could not decode in place, copy the frame into the stack
+                if frame.shape != dst.shape:
+                    # the backend reported another size than the real one (or the stream changed size):
+                    # the stacks are allocated again, after giving back the frames of the old size
+                    if n > 0:
+                        self.pending = frame
+                        break
+                    self.allocate(frame.shape)
+                    dst = self.frames[n]
+                dst[:] = frame
+            cv.cvtColor(dst, cv.COLOR_BGR2GRAY, dst=self.grays[n])
+            n += 1
+        return n, self.frames[:n], self.grays[:n]
+
+
+def threshold_stage(gray):
+    # Otsu's binarization of a frame, skipped by the MotionGate of the loop when the frame didn't change
+    ret, binary = cv.threshold(gray, 0, 255, cv.THRESH_BINARY + cv.THRESH_OTSU)
+    return binary
+
+
+######## Processing one video on all cores ########
+
+# For offline re-processing we don't need to play the video in order, we only need the results in order.
+# So we split the file into frame ranges (shards) and give each range to a worker process with its own VideoCapture.
+# Each worker seeks to the first frame of its range with cap.set(cv.CAP_PROP_POS_FRAMES, start).
+
+# Warning
+# Seeking in compressed video is not always exact: many backends land on the previous keyframe,
+# some ignore the request. So after seeking we check the position with cap.get(cv.CAP_PROP_POS_FRAMES),
+# read forward with cap.grab() when we are before the start, and start over from frame 0 when the seek went wrong.
+# CAP_PROP_FRAME_COUNT is only an estimate (computed from the duration and the fps by many backends),
+# so the last shard reads until the end of the file, and a shard that ends before its stop raises an error.
+# This way every frame is processed exactly once, whatever the keyframe layout of the file.
+
+def frame_pipeline(frame):
+    # the per-frame work, it must be a top-level function so the worker processes can find it
+    gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+    return float(gray.mean())
+
+def split_ranges(num_frames, num_shards):
+    # returns [(start, stop), ...] covering 0..num_frames, as equal as possible
+    bounds = np.linspace(0, num_frames, num_shards + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+def seek_exact(cap, start):
+    if start == 0:
+        return True
+    cap.set(cv.CAP_PROP_POS_FRAMES, start)
+    pos = int(cap.get(cv.CAP_PROP_POS_FRAMES))
+    if pos > start or pos < 0:
+        # the backend jumped past the frame we asked for, rewind
+        cap.set(cv.CAP_PROP_POS_FRAMES, 0)
+        pos = int(cap.get(cv.CAP_PROP_POS_FRAMES))
+        if pos != 0:
+            return False
+    # landed on an earlier keyframe, decode forward up to start
+    while pos < start:
+        if not cap.grab():
+            return False
+        pos += 1
+    return True
+
+def process_shard(args):
+    # returns (start, [func(frame) for the frames start..stop]), stop = None reads until the end of the file
+    path, start, stop, func = args
+    cap = cv.VideoCapture(path)
+    results = []
+    if not seek_exact(cap, start):
+        raise RuntimeError("could not seek to frame %d of %s" % (start, path))
+    while stop is None or start + len(results) < stop:
+        ret, frame = cap.read()
+        if ret == False:
+            break
+        results.append(func(frame))
+    cap.release()
+    if stop is not None and len(results) != stop - start:
+        raise RuntimeError("frames %d to %d of %s: could only read %d frames" % (start, stop, path, len(results)))
+    return start, results
+
+def process_video_sharded(path, func=frame_pipeline, num_workers=None):
+    # returns a list with func(frame) for every frame, in the original frame order
+    cap = cv.VideoCapture(path)
+    num_frames = int(cap.get(cv.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    if num_workers is None:
+        num_workers = mp.cpu_count()
+    ranges = split_ranges(max(num_frames, 1), num_workers)
+    # the frame count may be short, the last shard goes on until the end of the file
+    ranges[-1] = (ranges[-1][0], None)
+
+    with mp.Pool(num_workers) as pool:
+        shards = pool.map(process_shard, [(path, start, stop, func) for start, stop in ranges])
+
+    # every shard has to start right where the previous one stopped
+    results = []
+    for start, shard in sorted(shards, key=lambda s: s[0]):
+        if start != len(results):
+            raise RuntimeError("%s: shard starting at frame %d follows frame %d" % (path, start, len(results)))
+        results.extend(shard)
+    return results
+
+# Note
+# Worker processes may import this file again (on Windows and macOS they are spawned, not forked),
+# so the code that opens the video and the windows only runs when the file is executed directly.
+# Run it with --sharded to process the whole file on all cores instead of playing it.
+if __name__ == '__main__':
+    if '--sharded' in sys.argv:
+        e1 = cv.getTickCount()
+        results = process_video_sharded('bird.avi')
+        e2 = cv.getTickCount()
+        print("Processed %d frames in %f seconds" % (len(results), (e2 - e1) / cv.getTickFrequency()))
+        sys.exit(0)
+
+    # create VideoCapture object with movieFile
+    # Its argument can be either the device index or the name of a video file
+    cap = cv.VideoCapture('bird.avi')
+
+    # check if cap is initialized, if not initialize it
+    if cap.isOpened() == False:
+        cap.open()
+
+    # You can also access some of the features of this video using 
+    # cap.get(propId) method where propId is a number from 0 to 18
+    # For example, I can check the frame width and height by: 
+    # cap.get(3) and cap.get(4). It gives me 640x480 by default
 
-# check if cap is initialized, if not initialize it
-if cap.isOpened() == False:
-	cap.open()
+    # Some of these values can be modified using cap.set(propId, value)
 
-# You can also access some of the features of this video using 
-# cap.get(propId) method where propId is a number from 0 to 18
-# For example, I can check the frame width and height by: 
-# cap.get(3) and cap.get(4). It gives me 640x480 by default
+    reader = BatchReader(cap, batch_size=16)
+    gate = MotionGate()
+    stop = False
 
-# Some of these values can be modified using cap.set(propId, value)
+    while(cap.isOpened() and not stop):
+        # Capture a batch of frames, already converted to grayscale
+        n, frames, grays = reader.read_batch()
+        if n == 0:
+            break
 
-while(cap.isOpened()):
-    # Capture frame-by-frame
-    # returns a bool (True/False). True If frame is read correctly
-    ret, frame = cap.read()
+        for gray in grays:
+            binary = gate.run(gray, threshold_stage)
 
-    if ret == True:
-        # Our operations on the frame come here -> convert to grayscale
-        gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+            # Display the resulting frame
+            cv.imshow('frame', gray)
+            cv.imshow('threshold', binary)
 
-        # Display the resulting frame
-        cv.imshow('frame', gray)
+            # wait until q key is stroked to exit the loop and terminate
+            # waits 25 msec for normal video playback
+            if cv.waitKey(25) & 0xFF == ord('q'):
+                stop = True
+                break
 
-    # wait until q key is stroked to exit the loop and terminate
-    # waits 25 msec for normal video playback
-    if cv.waitKey(25) & 0xFF == ord('q'):
-        break
+    print("unchanged frames skipped: %.1f%%" % (100 * gate.hit_rate()))
 
-# When everything done, release the capture
-cap.release()
-cv.destroyAllWindows()
\ No newline at end of file
+    # When everything done, release the capture
+    cap.release()
+    cv.destroyAllWindows()
\ No newline at end of file
@@ -1,3 +1,10 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+
 import numpy as np
 import cv2 as cv
 
@@ -15,7 +22,142 @@ fourcc = cv.VideoWriter_fourcc(*'XVID')
 # create VideoWriter object
 # arguments (out_file_name, fourcc, fps, frame_size, isColor=True)
 # 'isColor' flag: If it is True (default), encoder expect color frame, otherwise it works with grayscale frame.
-out = cv.VideoWriter('output.avi', fourcc, 20.0, (640,480))
+
+
+######## Writing frames from a background thread ########
+
+# out.write(frame) encodes the frame right away on the capture loop, so any hiccup of the encoder
+# delays the next cap.read() and we lose camera frames. Here the capture loop only puts the frame in a bounded queue
+# and a dedicated encoder thread writes it. When the encoder can't keep up, the queue fills and a backpressure policy decides:
+# 	- 'block' : write() waits until there is room in the queue (no frame is lost, the capture loop slows down)
+# 	- 'drop'  : the new frame is dropped and counted
+# 	- 'spill' : the new frame is saved to a temporary .npy file on disk and encoded later, in order
+# The VideoWriter is created on the first frame, so the frame size (and isColor) come from the frames themselves
+# instead of a hard-coded (640,480) that silently produces an empty file when the camera uses another size.
+# Note: write() keeps a reference to the frame, so don't modify it afterwards (copy it if you reuse the buffer).
+
+class AsyncVideoWriter:
+    def __init__(self, filename, fourcc, fps, max_queue=32, policy='block', spill_dir=None):
+        if policy not in ('block', 'drop', 'spill'):
+            raise ValueError("policy must be 'block', 'drop' or 'spill'")
+
+        self.filename = filename
+        self.fourcc = fourcc
+        self.fps = fps
+        self.max_queue = max_queue
+        self.policy = policy
+        self.spill_dir = spill_dir
+        self.own_spill_dir = False
+        self.out = None
+
+        self.pending = deque() # (enqueue time, frame) waiting in memory
+        self.spilled = deque() # (enqueue time, path) waiting on disk, always newer than pending
+        self.cond = threading.Condition()
+        self.closed = False
+
+        # statistics
+        self.written = 0
+        self.dropped = 0
+        self.spill_count = 0
+        self.max_depth = 0
+        self.encode_time = 0.0 # total time spent inside out.write()
+        self.max_encode_time = 0.0
+        self.max_latency = 0.0 # worst time from write() to the frame being encoded
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, frame):
+        with self.cond:
+            if self.out is None:
+                # detect frame size from the first frame, VideoWriter wants (width, height)
+                height, width = frame.shape[:2]
+                self.out = cv.VideoWriter(self.filename, self.fourcc, self.fps, (width, height), frame.ndim == 3)
+
+            if self.policy == 'block':
+                self.cond.wait_for(lambda: len(self.pending) < self.max_queue)
+            elif len(self.pending) >= self.max_queue or self.spilled:
+                # queue is full (or frames are already waiting on disk, so the order must be kept)
+                if self.policy == 'drop':
+                    self.dropped += 1
+                    return False
+                self._spill(frame)
+                return True
+
+            self.pending.append((time.perf_counter(), frame))
+            self.max_depth = max(self.max_depth, self.depth())
+            self.cond.notify_all()
+        return True
+
+    def _spill(self, frame):
+        # called with the lock held
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='video_spill_')
+            self.own_spill_dir = True
+        path = os.path.join(self.spill_dir, 'frame_%08d.npy' % self.spill_count)
+        np.save(path, frame)
+        self.spill_count += 1
+        self.spilled.append((time.perf_counter(), path))
+        self.max_depth = max(self.max_depth, self.depth())
+        self.cond.notify_all()
+
+    def depth(self):
+        # number of frames waiting to be encoded (in memory and on disk)
+        return len(self.pending) + len(self.spilled)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending or self.spilled or self.closed)
+                if self.pending:
+                    queued_at, frame = self.pending.popleft()
+                elif self.spilled:
+                    queued_at, path = self.spilled.popleft()
+                    frame = None
+                else:
+                    break
+                self.cond.notify_all()
+
+            if frame is None:
+                frame = np.load(path)
+                os.remove(path)
+
+            e1 = time.perf_counter()
+            self.out.write(frame)
+            e2 = time.perf_counter()
+
+            with self.cond:
+                self.written += 1
+                self.encode_time += e2 - e1
+                self.max_encode_time = max(self.max_encode_time, e2 - e1)
+                self.max_latency = max(self.max_latency, e2 - queued_at)
+
+    def stats(self):
+        with self.cond:
+            return {
+                'written': self.written,
+                'dropped': self.dropped,
+                'spilled': self.spill_count,
+                'queue_depth': self.depth(),
+                'max_queue_depth': self.max_depth,
+                'mean_encode_ms': 1000.0 * self.encode_time / max(self.written, 1),
+                'max_encode_ms': 1000.0 * self.max_encode_time,
+                'max_latency_ms': 1000.0 * self.max_latency,
+            }
+
+    def release(self):
+        # encode everything still queued, then close the file
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join()
+        if self.out is not None:
+            self.out.release()
+        if self.own_spill_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+
+out = AsyncVideoWriter('output.avi', fourcc, 20.0, max_queue=32, policy='block')
 
 while(cap.isOpened()):
     ret, frame = cap.read()
@@ -35,4 +177,5 @@ while(cap.isOpened()):
 # Release everything if job is finished
 cap.release()
 out.release()
+print(out.stats())
 cv.destroyAllWindows()
\ No newline at end of file
@@ -61,6 +61,10 @@ img = cv.ellipse(img, (512-150,center_y), axis, -90, 45, 315, (255, 0, 0), thick
 font = cv.FONT_HERSHEY_SIMPLEX
 cv.putText(img, 'OpenCV', (70,464), font, 3, (255,255,255), 4, cv.LINE_AA)
 
+# Note
+# When the same text is drawn again and again (e.g. the logo on every frame of a video), rasterize it once and
+# blend the cached sprite instead: see LabelCache in 06_drawing.py.
+
 cv.imshow('OpenCV Logo', img)
 
 cv.waitKey(0)
@@ -1,6 +1,8 @@
 import cv2 as cv
 import numpy as np
 
+from history import TileHistory
+
 
 # we create a mouse callback function which is executed when a mouse event take place. Mouse event can be anything related to mouse like
 # left-button down, left-button up, left-button double-click etc. It gives us the coordinates (x,y) for every mouse event. With this event and
@@ -11,12 +13,19 @@ events = [i for i in dir(cv) if 'EVENT' in i]
 for event in events:
 	print (event)
 
+# Undo / Redo
+# Every double click only saves the 256x256 tiles the circle covers before drawing it (see TileHistory in history.py),
+# so the history stays small even on large images. Press 'u' to undo and 'r' to redo.
+
 def draw_circle(event, x, y, flags, param):
     if event == cv.EVENT_LBUTTONDBLCLK: # left click double click
+        history.touch(x - 100, y - 100, x + 101, y + 101)
         cv.circle(img, (x,y), 100, (255,0,0), -1)
+        history.commit()
 
 # Create a black image, a window and bind the function to window
 img = np.zeros((512,512,3), np.uint8)
+history = TileHistory(img)
 cv.namedWindow('image')
 
 # sets the mouse callback to the image we created
@@ -24,6 +33,11 @@ cv.setMouseCallback('image', draw_circle)
 
 while(1):
     cv.imshow('image', img)
-    if cv.waitKey(20) & 0xFF == 27: # press esc to exit
+    k = cv.waitKey(20) & 0xFF
+    if k == ord('u'):
+        history.undo()
+    elif k == ord('r'):
+        history.redo()
+    elif k == 27: # press esc to exit
         break
 cv.destroyAllWindows()
\ No newline at end of file
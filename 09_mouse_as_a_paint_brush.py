@@ -1,10 +1,116 @@
 import cv2 as cv
 import numpy as np
 
+from history import TileHistory
+
 drawing = False # true if mouse is pressed
-mode = True # if True, draw rectangle. Press 'm' to toggle to curve
+mode = True # if True, draw rectangle. Press 'm' to toggle to curve, 'u' to undo and 'r' to redo
 ix,iy = -1,-1
 
+# Note
+# Drawing straight into the image from the mouse callback and calling cv.imshow on the whole canvas every millisecond
+# works for a 512x512 image, but not for a large (8K) one. So the canvas below:
+# 	- keeps the committed drawing (img) apart from what is shown (view = drawing + the rectangle being dragged).
+# 	  The rectangle being dragged is only an overlay on the view, it's painted into img once, when the button is released.
+# 	- only records the mouse events in the callback. The brush points received between two refreshes are drawn together,
+# 	  and of all the mouse moves while dragging a rectangle only the last one matters.
+# 	- remembers the dirty rectangles (the parts of img that changed, and where the overlay was) and copies only those
+# 	  into the view. cv.imshow is called only when something changed.
+
+# Undo / Redo
+# TileHistory (history.py) only saves the tiles of the image a stroke modifies, before drawing it:
+# the canvas tells it which region is about to change with touch(), and ends every stroke with commit().
+
+class Canvas:
+    def __init__(self, img, window, history=None):
+        self.img = img
+        self.view = img.copy()
+        self.window = window
+        self.history = history
+        self.stroke_done = False
+        self.dirty = []         # (x0, y0, x1, y1) regions of the view to copy again from img
+        self.points = []        # brush points not drawn yet
+        self.overlay = None     # rectangle currently shown on the view only
+        self.new_overlay = None # rectangle to show at the next refresh
+        self.changed = True
+
+    def mark(self, x0, y0, x1, y1):
+        rows, cols = self.img.shape[:2]
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, cols), min(y1, rows)
+        if x0 < x1 and y0 < y1:
+            self.dirty.append((x0, y0, x1, y1))
+            self.changed = True
+
+    def brush(self, x, y):
+        self.points.append((x, y))
+
+    def preview(self, p1, p2):
+        self.new_overlay = (p1, p2)
+
+    def rectangle(self, p1, p2, color):
+        self.new_overlay = None
+        region = (min(p1[0], p2[0]), min(p1[1], p2[1]), max(p1[0], p2[0]) + 1, max(p1[1], p2[1]) + 1)
+        if self.history is not None:
+            self.history.touch(*region)
+        cv.rectangle(self.img, p1, p2, color, -1)
+        self.mark(*region)
+
+    def end_stroke(self):
+        # the stroke is committed to the history at the next refresh, after its last brush points are drawn
+        self.stroke_done = True
+
+    def undo(self):
+        if self.history is not None:
+            for region in self.history.undo():
+                self.mark(*region)
+
+    def redo(self):
+        if self.history is not None:
+            for region in self.history.redo():
+                self.mark(*region)
+
+    def refresh(self, radius=5, brush_color=(0,0,255), overlay_color=(0,255,0)):
+        # draw the brush points received since the last refresh
+        if self.points:
+            xs = [x for x, y in self.points]
+            ys = [y for x, y in self.points]
+            region = (min(xs) - radius, min(ys) - radius, max(xs) + radius + 1, max(ys) + radius + 1)
+            if self.history is not None:
+                self.history.touch(*region)
+            for x, y in self.points:
+                cv.circle(self.img, (x,y), radius, brush_color, -1)
+            self.mark(*region)
+            self.points = []
+
+        if self.stroke_done:
+            if self.history is not None:
+                self.history.commit()
+            self.stroke_done = False
+
+        # the overlay moved: erase the old one
+        if self.new_overlay != self.overlay:
+            if self.overlay is not None:
+                p1, p2 = self.overlay
+                self.mark(min(p1[0], p2[0]), min(p1[1], p2[1]), max(p1[0], p2[0]) + 1, max(p1[1], p2[1]) + 1)
+            self.overlay = self.new_overlay
+            self.changed = True
+
+        if not self.changed:
+            return False
+
+        for x0, y0, x1, y1 in self.dirty:
+            self.view[y0:y1, x0:x1] = self.img[y0:y1, x0:x1]
+        self.dirty = []
+
+        if self.overlay is not None:
+            cv.rectangle(self.view, self.overlay[0], self.overlay[1], overlay_color, -1)
+
+        cv.imshow(self.window, self.view)
+        self.changed = False
+        return True
+
+
 # mouse callback function
 def draw_circle(event, x,y , flags, param):
     global ix, iy, drawing, mode
@@ -16,28 +122,34 @@ def draw_circle(event, x,y , flags, param):
     elif event == cv.EVENT_MOUSEMOVE:
         if drawing == True:
             if mode == True:
-                cv.rectangle(img, (ix,iy), (x,y), (0,255,0), -1)
+                canvas.preview((ix,iy), (x,y))
             else:
-                cv.circle(img, (x,y), 5, (0,0,255), -1)
+                canvas.brush(x, y)
 
     elif event == cv.EVENT_LBUTTONUP:
         drawing = False
         if mode == True:
-            cv.rectangle(img, (ix,iy), (x,y), (0,255,0), -1)
+            canvas.rectangle((ix,iy), (x,y), (0,255,0))
         else:
-            cv.circle(img, (x,y), 5, (0,0,255), -1)
+            canvas.brush(x, y)
+        canvas.end_stroke()
 
 
 img = np.zeros((512,512,3), np.uint8)
 cv.namedWindow('image')
+canvas = Canvas(img, 'image', TileHistory(img))
 cv.setMouseCallback('image', draw_circle)
 
 while(1):
-    cv.imshow('image', img)
-    k = cv.waitKey(1) & 0xFF
+    canvas.refresh()
+    k = cv.waitKey(15) & 0xFF
     if k == ord('m'):
         mode = not mode
+    elif k == ord('u'):
+        canvas.undo()
+    elif k == ord('r'):
+        canvas.redo()
     elif k == 27:
         break
 
-cv.destroyAllWindows()
\ No newline at end of file
+cv.destroyAllWindows()
@@ -1,6 +1,8 @@
 import cv2 as cv
 import numpy as np
 
+from trackbars import TrackbarPanel
+
 # Here we will create a simple application which shows the color you specify. 
 # You have a window which shows the color and three trackbars to specify each of B,G,R colors.
 # You slide the trackbar and correspondingly window color changes. By default, initial color will be set to Black.
@@ -13,43 +15,40 @@ import numpy as np
 # fifth argument:  is the callback function which is executed everytime trackbar value changes. 
 
 # The callback function always has a default argument which is the trackbar position. 
-# In our case, function does nothing, so we simply pass.
+# In our case, the callback only records the new position and the window is redrawn later (see TrackbarPanel below).
 
 # Another important application of trackbar is to use it as a button or switch. 
 # OpenCV, by default, doesn’t have button functionality. So you can use trackbar to get such functionality.
 # In our application, we have created one switch in which application works only if switch is ON, otherwise screen is always black.
 
-def nothing(x):
-    pass
+# Note
+# TrackbarPanel (see trackbars.py) redraws the image only when a trackbar moved, redraw() updates it in place (img[:] = ...).
 
 # Create a black image, a window
 img = np.zeros((300,512,3), np.uint8)
 cv.namedWindow('image')
 
+panel = TrackbarPanel('image')
+
 # create trackbars for color change
-cv.createTrackbar('R', 'image', 0, 255, nothing)
-cv.createTrackbar('G', 'image', 0, 255, nothing)
-cv.createTrackbar('B', 'image', 0, 255, nothing)
+panel.add('R', 0, 255)
+panel.add('G', 0, 255)
+panel.add('B', 0, 255)
 
 # create switch for ON/OFF functionality
 switch = '0 : OFF \n1 : ON'
-cv.createTrackbar(switch, 'image', 0, 1, nothing)
+panel.add(switch, 0, 1)
 
-while(1):
+def redraw(values):
+    if values[switch] == 0:
+        img[:] = 0
+    else:
+        img[:] = [values['B'], values['G'], values['R']]
     cv.imshow('image', img)
-    k = cv.waitKey(1) & 0xFF
+
+while(1):
+    k = panel.refresh(redraw)
     if k == 27: # esc button
         break
 
-    # get current positions of four trackbars
-    r = cv.getTrackbarPos('R','image')
-    g = cv.getTrackbarPos('G','image')
-    b = cv.getTrackbarPos('B','image')
-    s = cv.getTrackbarPos(switch,'image')
-
-    if s == 0:
-        img[:] = 0
-    else:
-        img[:] = [b,g,r]
-
 cv.destroyAllWindows()
\ No newline at end of file
@@ -2,6 +2,9 @@ import cv2 as cv
 import numpy as np
 from matplotlib import pyplot as plt
 
+import channels
+import tiles
+
 # load a color image
 img = cv.imread('messi5.jpg')
 
@@ -96,6 +99,17 @@ r = img[:,:,2]
 # You can simply use Numpy indexing which is faster.
 img[:,:,2] = 0
 
+# Note
+# These numpy channels are views: they share the memory of img, no pixel is copied.
+# channels.py wraps them as a split / merge / reorder API, and tells when a copy can't be avoided
+# (OpenCV functions need a contiguous layout, a channel view like img[:,:,0] is copied when it's given to them).
+
+b, g, r = channels.split(img)         # views, like the numpy indexing above
+rgb = channels.reorder(img, 'rgb')    # view: img[:,:,::-1]
+bgr = channels.merge((b, g, r))       # view of img again, no copy
+gray = cv.cvtColor(channels.for_opencv(rgb, 'cvtColor'), cv.COLOR_RGB2GRAY) # here the copy is needed, and recorded
+print(channels.copy_log.summary())
+
 
 
 ####### Making Borders for Images (Padding) #######
@@ -135,4 +149,18 @@ plt.subplot(235),plt.imshow(replicate,'gray'),plt.title('REPLICATE')
 plt.subplot(236),plt.imshow(wrap,'gray'),plt.title('WRAP')
 
 
-plt.show()
\ No newline at end of file
+plt.show()
+
+
+
+####### Processing an image tile by tile #######
+
+# A border is also what makes it possible to filter an image that doesn't fit in memory:
+# cut it into tiles, add to every tile a border (halo) as wide as the footprint of the filter, filter the tile with its halo,
+# and keep only the center. Inside the image the halo is made of the neighbouring pixels,
+# at the edges of the image it's made with copyMakeBorder, like the filter would do on the whole image.
+# tiles.py does it for .npy files opened as memory maps, with a pool of worker processes (python tiles.py --help).
+
+img = cv.imread('messi5.jpg')
+median = tiles.process_tiled(img, None, tiles.median_op(5), tile_size=128, workers=1)
+print("same result as cv.medianBlur on the whole image:", np.array_equal(median, cv.medianBlur(img, 5)))
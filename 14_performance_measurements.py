@@ -1,6 +1,12 @@
+import json
+from time import perf_counter_ns
+
+import numpy as np
 import cv2 as cv
 import ipython
 
+from image_cache import ImageCache
+
 # In image processing, since you are dealing with large number of operations per second, 
 # it is mandatory that your code is not only providing the correct solution, 
 # but also in the fastest manner. So in this chapter, you will learn:
@@ -33,7 +39,237 @@ print("Time taken: %f seconds" % t)
 
 
 
+######## Decoding an image only once ########
+
+# Most of the time of cv.imread is the decoding (JPEG, PNG), and the scripts read messi5.jpg again and again.
+# ImageCache (image_cache.py) stores the decoded pixels in a .npy file and opens it as a memory map the next time:
+# the key is (path, modification time, size, flags), so a modified file is decoded again.
+# The cached images are read-only, copy them before drawing on them.
+
+cache = ImageCache()
+
+e1 = cv.getTickCount()
+for i in range(100):
+    img = cv.imread('messi5.jpg')
+e2 = cv.getTickCount()
+for i in range(100):
+    img = cache.imread('messi5.jpg')
+e3 = cv.getTickCount()
+
+print("cv.imread: %f ms, ImageCache.imread: %f ms per image (%d hits, %d misses)" % (
+      10 * (e2 - e1) / cv.getTickFrequency(), 10 * (e3 - e2) / cv.getTickFrequency(), cache.hits, cache.misses))
+
+
+
+######## Per-stage latency histograms ########
+
+# A single measurement around a whole block tells us how long the block took once.
+# In a capture loop we want to know, for every stage (grab, decode, color conversion, threshold, draw, display, write),
+# how long it usually takes and how bad the slow frames are (p95, p99), because the slow frames are the ones that break the frame budget.
+
+# Keeping every sample would grow without bounds, so each stage gets a histogram with fixed buckets instead.
+# The buckets work on nanoseconds (time.perf_counter_ns, about twice as cheap as cv.getTickCount from Python):
+# every power of two is split into 8 equal buckets, so any percentile is known within 12.5% whatever the scale
+# of the stage (microseconds or seconds). The bucket of a sample is its bit_length() and the 3 bits after the highest one.
+# Even that is too slow to do in Python while the loop runs, so add() only appends the sample to a list,
+# and every FLUSH_SIZE samples (and before reading the results) the list is folded into the buckets with numpy.
+
+class LatencyHistogram:
+    NUM_BUCKETS = 16 + 60 * 8 # values below 16 ns get their own bucket, then 8 buckets per power of two
+    FLUSH_SIZE = 4096
+
+    def __init__(self):
+        self.counts = np.zeros(self.NUM_BUCKETS, np.int64)
+        self.samples = []
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, ns):
+        samples = self.samples
+        samples.append(ns)
+        if len(samples) >= self.FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        # the list is emptied in place (Stage keeps a reference to it), only the samples folded here are removed,
+        # so the ones added meanwhile by another thread are kept for the next flush
+        n = len(self.samples)
+        if n == 0:
+            return
+        samples = np.array(self.samples[:n], np.int64)
+        del self.samples[:n]
+        # b = bit_length of every sample (np.frexp is exact below 2**53 ns), and when b > 4 the 4 highest bits
+        # are 1xxx, xxx is the sub-bucket inside this power of two
+        b = np.frexp(samples)[1]
+        index = np.where(b > 4, 8 * b - 32 + (samples >> np.maximum(b - 4, 0)), np.maximum(samples, 0))
+        self.counts += np.bincount(index, minlength=self.NUM_BUCKETS)
+        self.count += n
+        self.total += int(samples.sum())
+        self.max = max(self.max, int(samples.max()))
+
+    @staticmethod
+    def bucket_range(i):
+        # [low, high) in nanoseconds of the bucket i
+        if i < 16:
+            return i, i + 1
+        octave, sub = divmod(i - 16, 8)
+        width = 1 << (octave + 1)
+        return (8 + sub) * width, (9 + sub) * width
+
+    def percentile(self, p):
+        # upper edge (in seconds) of the bucket holding the p-th percentile sample
+        self.flush()
+        if self.count == 0:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if c > 0 and seen >= rank:
+                return min(self.bucket_range(i)[1], self.max) / 1e9
+        return self.max / 1e9
+
+    def summary(self):
+        # times in milliseconds
+        self.flush()
+        return {
+            'count': self.count,
+            'mean_ms': self.total / 1e6 / max(self.count, 1),
+            'p50_ms': 1000.0 * self.percentile(50),
+            'p95_ms': 1000.0 * self.percentile(95),
+            'p99_ms': 1000.0 * self.percentile(99),
+            'max_ms': self.max / 1e6,
+        }
+
+    def buckets(self):
+        # non-empty buckets as [low_ms, high_ms, count]
+        self.flush()
+        ms = 1e-6
+        result = []
+        for i, c in enumerate(self.counts):
+            if c > 0:
+                low, high = self.bucket_range(i)
+                result.append([low * ms, high * ms, int(c)])
+        return result
+
+
+# StageTimers keeps one histogram per named stage. There are two ways to time a stage:
+# 	- with timers.stage('decode'): ...                   (the readable way)
+# 	- t = timers.start(); ...; timers.stop('decode', t)  (no context manager, a bit cheaper)
+# The Stage objects are created once per name and reused, so timing does not allocate.
+# A Stage keeps the start times of its open `with` blocks on a stack, so a stage can be nested in itself
+# (a recursive function), but it must not be used by two threads at the same time: their starts would mix.
+# From other threads (e.g. the grabber thread of 03), use start()/stop(): the start time is returned to the caller,
+# nothing is shared but the list of samples, and list.append is atomic.
+
+class Stage:
+    def __init__(self, hist):
+        self.hist = hist
+        self.samples = hist.samples
+        self.starts = []
+
+    def __enter__(self):
+        self.starts.append(perf_counter_ns())
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # LatencyHistogram.add() inlined, a method call is a good part of the cost here
+        samples = self.samples
+        samples.append(perf_counter_ns() - self.starts.pop())
+        if len(samples) >= LatencyHistogram.FLUSH_SIZE:
+            self.hist.flush()
+        return False
+
+class StageTimers:
+    def __init__(self):
+        self.hists = {}
+        self.stages = {}
+
+    def stage(self, name):
+        s = self.stages.get(name)
+        if s is None:
+            self.hists[name] = LatencyHistogram()
+            s = self.stages[name] = Stage(self.hists[name])
+        return s
+
+    start = staticmethod(perf_counter_ns)
+
+    def stop(self, name, t):
+        self.stage(name).hist.add(perf_counter_ns() - t)
+
+    def summary(self):
+        return {name: hist.summary() for name, hist in self.hists.items()}
+
+    def dump_json(self, path=None):
+        # summaries plus the non-empty buckets, so histograms from several runs can be merged later
+        data = {
+            'stages': self.summary(),
+            'buckets': {name: hist.buckets() for name, hist in self.hists.items()},
+        }
+        if path is None:
+            return json.dumps(data, indent=2)
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+
+
+# Below is a video loop like the ones in 03/04/15 with every stage timed:
+
+timers = StageTimers()
+cap = cv.VideoCapture('bird.avi')
+
+while(cap.isOpened()):
+    with timers.stage('grab'):
+        ret = cap.grab()
+    if ret == False:
+        break
+
+    with timers.stage('decode'):
+        ret, frame = cap.retrieve()
+
+    with timers.stage('color conversion'):
+        gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+
+    with timers.stage('threshold'):
+        ret, th = cv.threshold(gray, 0, 255, cv.THRESH_BINARY+cv.THRESH_OTSU)
+
+    with timers.stage('draw'):
+        cv.putText(frame, 'thresh: %d' % ret, (10,30), cv.FONT_HERSHEY_SIMPLEX, 1, (0,255,0), 2, cv.LINE_AA)
+
+    with timers.stage('display'):
+        cv.imshow('frame', frame)
+        k = cv.waitKey(1) & 0xFF
+
+    if k == ord('q'):
+        break
+
+cap.release()
+cv.destroyAllWindows()
+
+print(timers.dump_json())
+
+# How much does timing itself cost? Time an empty stage many times.
+# In hot loops, look the stage up once before the loop instead of passing its name every time:
+n = 100000
+empty = timers.stage('empty')
+e1 = perf_counter_ns()
+for i in range(n):
+    with empty:
+        pass
+e2 = perf_counter_ns()
+add = empty.hist.add
+for i in range(n):
+    t = perf_counter_ns()
+    add(perf_counter_ns() - t)
+e3 = perf_counter_ns()
+print("cost per sample: %.3f us (with), %.3f us (explicit)" % ((e2 - e1) / 1000.0 / n, (e3 - e2) / 1000.0 / n))
+
+
 ######### Default Optimization in OpenCV #########
 
 # Rest of this Code Note is in this notebook:
-#	-> Measuring Performance in IPython.ipynb
\ No newline at end of file
+#	-> Measuring Performance in IPython.ipynb
+#
+# To benchmark the operations used in these scripts from the command line, and compare with a previous run:
+#	-> python benchmark_suite.py --output results.json
+#	-> python benchmark_suite.py --baseline results.json
\ No newline at end of file
@@ -1,6 +1,9 @@
 import cv2 as cv
 import numpy as np
 
+from motion_gate import MotionGate
+from trackbars import TrackbarPanel
+
 ###### Changing Color-space ######
 # There are more than 150 color-space conversion methods available in OpenCV. 
 # But we will look into only two which are most widely used ones, BGR to Gray and BGR to HSV.
@@ -21,30 +24,31 @@ print("Number of flags:", len(flags))
 
 # Create a black image, a window
 img = np.zeros((300,512,3), np.uint8)
-cv.imshow('image', img)
-
-def changeImageColor(x):
-    # get current positions of four trackbars
-    h = cv.getTrackbarPos('H','image')
-    s = cv.getTrackbarPos('S','image')
-    v = cv.getTrackbarPos('V','image')
+hsv = np.zeros((300,512,3), np.uint8)
+cv.namedWindow('image')
 
-    global img
+# Note
+# Filling the image, converting it with cv.cvtColor (which allocates a new image) and calling cv.imshow inside the trackbar callback
+# does all that work on every single tick of a trackbar. TrackbarPanel (trackbars.py) only records the new positions,
+# and the main loop redraws once per display refresh if something changed, converting into the same image buffer.
 
-    img[:] = [h,s,v]
-    img = cv.cvtColor(img, cv.COLOR_HSV2BGR)
+def changeImageColor(values):
+    hsv[:] = [values['H'], values['S'], values['V']]
+    cv.cvtColor(hsv, cv.COLOR_HSV2BGR, dst=img)
 
     cv.imshow('image', img)
 
 
 
+panel = TrackbarPanel('image')
+
 # create trackbars for color change
-cv.createTrackbar('H', 'image', 0, 179, changeImageColor)
-cv.createTrackbar('S', 'image', 0, 255, changeImageColor)
-cv.createTrackbar('V', 'image', 0, 255, changeImageColor)
+panel.add('H', 0, 179)
+panel.add('S', 0, 255)
+panel.add('V', 0, 255)
 
 while(1):
-    k = cv.waitKey(1) & 0xFF
+    k = panel.refresh(changeImageColor)
     if k == 27: # esc button
         break
 
@@ -62,13 +66,10 @@ cv.destroyAllWindows()
 # 	- We threshold the HSV image for a range of blue color
 #	- Now extract the blue object alone, we can do whatever on that image we want.
 
-cap = cv.VideoCapture(0)
-
-while(1):
-
-    # Take each frame
-    _, frame = cap.read()
+# With a fixed camera, most frames show the same scene: MotionGate (motion_gate.py) skips the conversion
+# and the threshold when the frame didn't change, and reuses the last mask.
 
+def blue_mask(frame):
     # Convert BGR to HSV
     hsv = cv.cvtColor(frame, cv.COLOR_BGR2HSV)
 
@@ -77,7 +78,17 @@ while(1):
     upper_blue = np.array([130,255,255])
 
     # Threshold the HSV image to get only blue colors
-    mask = cv.inRange(hsv, lower_blue, upper_blue)
+    return cv.inRange(hsv, lower_blue, upper_blue)
+
+cap = cv.VideoCapture(0)
+gate = MotionGate()
+
+while(1):
+
+    # Take each frame
+    _, frame = cap.read()
+
+    mask = gate.run(frame, blue_mask)
 
     # Bitwise-AND mask and original image
     res = cv.bitwise_and(frame, frame, mask= mask)
@@ -98,6 +109,101 @@ cv.destroyAllWindows()
 # draw diagrams just by moving your hand in front of camera and many other funny stuffs
 
 
+####### Tracking the centroid in a search window #######
+
+# The loop above thresholds the whole frame every time, even when the object is small and we know where it was a frame ago.
+# ColorTracker finds the object once on the full frame, computes its centroid with cv.moments,
+# and on the next frames converts and thresholds only a search window around the last known bounding box:
+# 	- found in the window: the window follows the object (bounding box + `margin` pixels on every side).
+# 	- lost: the margin grows by `grow` at every frame, so a fast object is found again in a bigger window.
+# 	- lost for more than `max_misses` frames (or the window covers the whole frame anyway): back to a full-frame scan.
+# The moments are computed on the window mask, so the centroid is shifted by the window position to get frame coordinates.
+
+class ColorTracker:
+    def __init__(self, lower, upper, margin=32, grow=2.0, max_misses=5, min_area=50):
+        self.lower = np.array(lower)
+        self.upper = np.array(upper)
+        self.margin = margin
+        self.grow = grow
+        self.max_misses = max_misses
+        self.min_area = min_area
+
+        self.bbox = None      # (x, y, w, h) of the object in the last frame where it was found
+        self.misses = 0
+        self.centroid = None
+        self.window = None    # (x0, y0, x1, y1) processed in the last frame
+        self.mask = None      # mask of that window
+        self.pixels = 0       # statistics: pixels processed vs pixels in the frames
+        self.frame_pixels = 0
+
+    def search_window(self, shape):
+        rows, cols = shape[:2]
+        if self.bbox is None or self.misses > self.max_misses:
+            return 0, 0, cols, rows
+        x, y, w, h = self.bbox
+        m = int(self.margin * self.grow ** self.misses)
+        return max(x - m, 0), max(y - m, 0), min(x + w + m, cols), min(y + h + m, rows)
+
+    def track(self, frame):
+        # returns the centroid (x, y) of the object in frame coordinates, or None if it's not found
+        x0, y0, x1, y1 = self.search_window(frame.shape)
+        full = (x1 - x0) * (y1 - y0) == frame.shape[0] * frame.shape[1]
+
+        roi = frame[y0:y1, x0:x1]
+        hsv = cv.cvtColor(roi, cv.COLOR_BGR2HSV)
+        mask = cv.inRange(hsv, self.lower, self.upper)
+
+        self.window = (x0, y0, x1, y1)
+        self.mask = mask
+        self.pixels += mask.size
+        self.frame_pixels += frame.shape[0] * frame.shape[1]
+
+        M = cv.moments(mask, True)
+        if M['m00'] >= self.min_area:
+            self.centroid = (x0 + M['m10'] / M['m00'], y0 + M['m01'] / M['m00'])
+            x, y, w, h = cv.boundingRect(mask)
+            self.bbox = (x0 + x, y0 + y, w, h)
+            self.misses = 0
+        else:
+            self.centroid = None
+            if full:
+                # not in the frame at all: keep scanning the full frame
+                self.bbox = None
+                self.misses = 0
+            else:
+                self.misses += 1
+        return self.centroid
+
+
+cap = cv.VideoCapture(0)
+tracker = ColorTracker([110,50,50], [130,255,255])
+
+while(1):
+
+    # Take each frame
+    _, frame = cap.read()
+
+    # not behind a MotionGate: the tracker only works on its search window anyway,
+    # and it must follow a small target even when the rest of the frame doesn't change
+    centroid = tracker.track(frame)
+
+    # draw the search window and the centroid
+    x0, y0, x1, y1 = tracker.window
+    cv.rectangle(frame, (x0,y0), (x1-1,y1-1), (0,255,0), 1)
+    if centroid is not None:
+        cv.circle(frame, (int(centroid[0]), int(centroid[1])), 5, (0,0,255), -1)
+
+    cv.imshow('frame',frame)
+    cv.imshow('mask',tracker.mask)
+    k = cv.waitKey(5) & 0xFF
+    if k == 27:
+        break
+
+cv.destroyAllWindows()
+
+print("processed %.1f%% of the pixels" % (100.0 * tracker.pixels / max(tracker.frame_pixels, 1)))
+
+
 ####### How to find HSV values to track? #######
 
 # It is very simple and you can use the same function, cv2.cvtColor(). Instead of passing an image, 
@@ -1,6 +1,8 @@
 import cv2 as cv
 import numpy as np
 
+from motion_gate import MotionGate
+
 ###### Changing Color-space ######
 # There are more than 150 color-space conversion methods available in OpenCV. 
 # But we will look into only two which are most widely used ones, BGR to Gray and BGR to HSV.
@@ -62,13 +64,9 @@ cv.destroyAllWindows()
 # 	- We threshold the HSV image for a range of blue color
 #	- Now extract the blue object alone, we can do whatever on that image we want.
 
-cap = cv.VideoCapture(0)
-
-while(1):
-
-    # Take each frame
-    _, frame = cap.read()
+# MotionGate (motion_gate.py) skips the conversion and the thresholds when the frame didn't change.
 
+def blue_yellow_mask(frame):
     # Convert BGR to HSV
     hsv = cv.cvtColor(frame, cv.COLOR_BGR2HSV)
 
@@ -89,6 +87,17 @@ while(1):
 
     mask = cv.bitwise_or(mask_b, mask_y)
     #mask = cv.bitwise_or(mask, mask_y)
+    return mask
+
+cap = cv.VideoCapture(0)
+gate = MotionGate()
+
+while(1):
+
+    # Take each frame
+    _, frame = cap.read()
+
+    mask = gate.run(frame, blue_yellow_mask)
 
     # Bitwise-AND mask and original image
     res = cv.bitwise_and(frame, frame, mask= mask)
@@ -102,6 +111,192 @@ while(1):
 
 cv.destroyAllWindows()
 
+
+###### Many colors in one pass ######
+
+# The loop above converts the whole frame to HSV, then runs one cv.inRange per color, then cv.bitwise_or for every extra color:
+# each new color costs another pass over the full frame. And the red range is commented out because the red hue wraps around:
+# it goes from 170 to 179 and continues from 0 to 10, which a single cv.inRange can't express.
+
+# A pixel's class only depends on its BGR value, and there are only 256*256*256 = 16.7M possible values.
+# So ColorClassifier computes the class of every possible BGR color once (a 16 MB lookup table, built with the same
+# cv.cvtColor and cv.inRange as above on an image holding all the colors), and classifying a frame is then a single lookup per pixel:
+# no HSV conversion and no per-color pass, whatever the number of colors.
+# 	- ranges are (name, lower, upper) in HSV. If lower hue > upper hue, the range wraps around: [170,50,50] -> [10,255,255] is red.
+# 	- the result is a label map: 0 where no range matches, i+1 where the pixel is in ranges[i] (the first matching range wins).
+# 	- masks(labels) returns the mask of every class (255 / 0, like cv.inRange), and labels > 0 is the union of all the classes.
+
+class ColorClassifier:
+    def __init__(self, ranges):
+        self.names = [name for name, lower, upper in ranges]
+
+        # every possible BGR color, as a 4096x4096 image. The color of index i is made of the 3 low bytes of i,
+        # in memory order (x86 and ARM are little-endian): the same bytes as a B,G,R,0 pixel read as one uint32
+        colors = np.arange(1 << 24, dtype=np.uint32)
+        bgr = np.ascontiguousarray(colors.view(np.uint8).reshape(-1, 4)[:, :3])
+        hsv = cv.cvtColor(bgr.reshape(4096, 4096, 3), cv.COLOR_BGR2HSV)
+
+        # paint the classes from the last to the first, so the first matching range wins
+        self.lut = np.zeros(1 << 24, np.uint8)
+        for label in range(len(ranges), 0, -1):
+            name, lower, upper = ranges[label - 1]
+            lower, upper = np.array(lower), np.array(upper)
+            if lower[0] <= upper[0]:
+                mask = cv.inRange(hsv, lower, upper)
+            else:
+                # hue wrap-around: [lower hue, 179] or [0, upper hue]
+                mask = cv.bitwise_or(cv.inRange(hsv, lower, np.array([179, upper[1], upper[2]])),
+                                     cv.inRange(hsv, np.array([0, lower[1], lower[2]]), upper))
+            self.lut[mask.ravel() > 0] = label
+
+        self.packed = None # preallocated B,G,R,0 frame, read as one uint32 per pixel
+        self.labels = None
+
+    def classify(self, frame):
+        # uint8 label map of a BGR frame
+        # Note: the label map is reused by the next call, copy it if you need to keep it
+        if self.packed is None or self.packed.shape[:2] != frame.shape[:2]:
+            self.packed = np.zeros(frame.shape[:2] + (4,), np.uint8)
+            self.labels = np.empty(frame.shape[:2], np.uint8)
+
+        # copy B,G,R into the first 3 channels, the 4th one stays 0
+        cv.mixChannels([frame], [self.packed], [0,0, 1,1, 2,2])
+        index = self.packed.view(np.uint32).reshape(frame.shape[:2])
+        return np.take(self.lut, index, out=self.labels)
+
+    def masks(self, labels):
+        # {name: mask} for every class
+        return {name: cv.compare(labels, label, cv.CMP_EQ) for label, name in enumerate(self.names, 1)}
+
+
+classifier = ColorClassifier([
+    ('blue',   [110,50,50], [130,255,255]),
+    ('yellow', [20,50,50],  [40,255,255]),
+    ('red',    [170,50,50], [10,255,255]),  # wraps around
+])
+gate = MotionGate()
+
+while(1):
+
+    # Take each frame
+    _, frame = cap.read()
+
+    # the stages run only when the frame changed, otherwise their last outputs are reused
+    gate.update(frame)
+
+    # one lookup per pixel for all the colors
+    labels = gate.stage('labels', classifier.classify, frame)
+
+    # union of all the colors, and the mask of a single one
+    mask = gate.stage('mask', cv.compare, labels, 0, cv.CMP_GT)
+    masks = gate.stage('masks', classifier.masks, labels)
+
+    # Bitwise-AND mask and original image
+    res = cv.bitwise_and(frame, frame, mask= mask)
+
+    cv.imshow('frame',frame)
+    cv.imshow('mask',mask)
+    cv.imshow('red',masks['red'])
+    cv.imshow('res',res)
+    k = cv.waitKey(5) & 0xFF
+    if k == 27:
+        break
+
+cv.destroyAllWindows()
+
+
+###### Coarse-to-fine color masks ######
+
+# On a high resolution camera most of the frame doesn't contain the color we are looking for,
+# but cv.cvtColor + cv.inRange still visit every pixel. PyramidMasker does the same work on a small copy of the frame first:
+# 	- the frame is reduced `levels` times by 2 (cv.resize with INTER_AREA, or cv.pyrDown), so 1/4 of the pixels per level.
+# 	  Halving with INTER_AREA is a plain 2x2 average and much cheaper than the 5x5 gaussian of cv.pyrDown.
+# 	- the coarse mask is dilated a little, because averaging can wash out thin borders of the object,
+# 	  and its blobs are found with cv.connectedComponentsWithStats.
+# 	- only inside the bounding boxes of those blobs (scaled back, plus `pad` pixels) the exact mask is computed at full resolution.
+# Objects smaller than the reduction (a few pixels at 1/4) can be missed. So every `check_every` frames the result is compared with
+# the full resolution mask, and if more than `tolerance` of the pixels differ, one level of reduction is dropped.
+
+class PyramidMasker:
+    def __init__(self, lower, upper, levels=2, pad=4, method='area', tolerance=0.0005, check_every=30):
+        self.lower = np.array(lower)
+        self.upper = np.array(upper)
+        self.levels = levels
+        self.pad = pad
+        self.method = method
+        self.tolerance = tolerance
+        self.check_every = check_every
+        self.frames = 0
+        self.error = 0.0 # fraction of differing pixels at the last check
+        self.boxes = []  # full resolution boxes (x0, y0, x1, y1) computed in the last frame
+
+    def full_mask(self, frame):
+        return cv.inRange(cv.cvtColor(frame, cv.COLOR_BGR2HSV), self.lower, self.upper)
+
+    def reduce(self, frame):
+        for i in range(self.levels):
+            if self.method == 'pyrdown':
+                frame = cv.pyrDown(frame)
+            else:
+                frame = cv.resize(frame, None, fx=0.5, fy=0.5, interpolation=cv.INTER_AREA)
+        return frame
+
+    def mask(self, frame):
+        if self.levels == 0:
+            self.boxes = [(0, 0, frame.shape[1], frame.shape[0])]
+            self.error = 0.0
+            return self.full_mask(frame)
+
+        coarse = self.full_mask(self.reduce(frame))
+        coarse = cv.dilate(coarse, np.ones((3,3), np.uint8))
+        n, labels, stats, centroids = cv.connectedComponentsWithStats(coarse)
+
+        rows, cols = frame.shape[:2]
+        scale = 1 << self.levels
+        mask = np.zeros((rows, cols), np.uint8)
+        self.boxes = []
+        for i in range(1, n): # label 0 is the background
+            x, y, w, h = stats[i, :4]
+            x0, y0 = max(x * scale - self.pad, 0), max(y * scale - self.pad, 0)
+            x1, y1 = min((x + w) * scale + self.pad, cols), min((y + h) * scale + self.pad, rows)
+            mask[y0:y1, x0:x1] = self.full_mask(frame[y0:y1, x0:x1])
+            self.boxes.append((x0, y0, x1, y1))
+
+        self.frames += 1
+        if self.check_every and self.frames % self.check_every == 0:
+            self.error = np.count_nonzero(mask != self.full_mask(frame)) / float(mask.size)
+            if self.error > self.tolerance:
+                self.levels -= 1
+        return mask
+
+
+masker = PyramidMasker([110,50,50], [130,255,255], levels=2)
+gate = MotionGate()
+
+while(1):
+
+    # Take each frame
+    _, frame = cap.read()
+
+    mask = gate.run(frame, masker.mask)
+
+    # Bitwise-AND mask and original image
+    res = cv.bitwise_and(frame, frame, mask= mask)
+
+    for x0, y0, x1, y1 in masker.boxes:
+        cv.rectangle(frame, (x0,y0), (x1-1,y1-1), (0,255,0), 1)
+
+    cv.imshow('frame',frame)
+    cv.imshow('mask',mask)
+    cv.imshow('res',res)
+    k = cv.waitKey(5) & 0xFF
+    if k == 27:
+        break
+
+cv.destroyAllWindows()
+
+print("pyramid levels: %d, differing pixels at last check: %f%%" % (masker.levels, 100 * masker.error))
+
 # Note
 
 # This is the simplest method in object tracking. Once you learn functions of contours, 
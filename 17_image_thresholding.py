@@ -2,6 +2,8 @@ import cv2 as cv
 import numpy as np
 from matplotlib import pyplot as plt
 
+from otsu import otsu_thresholds
+
 
 ######## Simple Thresholding ########
 
@@ -65,6 +67,110 @@ titles = ['Original Image', 'Global Thresholding (v = 127)',
             'Adaptive Mean Thresholding', 'Adaptive Gaussian Thresholding']
 images = [img, th1, th2, th3]
 
+for i in range(4):
+    plt.subplot(2,2,i+1), plt.imshow(images[i], 'gray')
+    plt.title(titles[i])
+    plt.xticks([]), plt.yticks([])
+plt.show()
+
+
+
+######## Local (adaptive) Otsu's Thresholding ########
+
+# Adaptive mean / gaussian thresholding compare every pixel to a local average. Otsu's method (see next chapter) usually
+# finds a better threshold, but only one for the whole image, which fails under uneven lighting.
+# Local Otsu combines both: the image is covered by a grid of tile centers (every `step` pixels),
+# Otsu's threshold is computed from the histogram of a `window` x `window` neighbourhood of each center,
+# and the thresholds are bilinearly interpolated between the centers to get one threshold per pixel.
+
+# Computing a full histogram for every window would cost window*window operations per center.
+# Instead the histograms slide:
+# 	- the left and right edges of all the windows cut a band of `window` rows into narrow vertical strips,
+# 	  and we keep one histogram per strip. Moving the band down by `step` rows only adds the rows entering the band
+# 	  and subtracts the rows leaving it.
+# 	- a window is a run of strips. Moving it right adds the entering strips and subtracts the leaving ones:
+# 	  with a cumulative sum C over the strips, every window of the band is C[right edge] - C[left edge], in one numpy expression.
+# Windows with almost no contrast (a flat background, std below `min_std`) have no meaningful Otsu's threshold,
+# so they use the global one.
+# The thresholds of all the windows of a band are computed in one call by otsu_thresholds (otsu.py).
+
+def strip_histograms(rows, strip_of_column, num_strips):
+    # histogram of every strip of a (k, W) block of rows -> (num_strips, 256)
+    # columns outside all the windows belong to the extra strip num_strips, which is dropped
+    bins = rows.astype(np.intp) + 256 * strip_of_column
+    return np.bincount(bins.ravel(), minlength=256 * (num_strips + 1)).reshape(num_strips + 1, 256)[:num_strips]
+
+def local_otsu_threshold(img, step=32, window=64, min_std=8.0):
+    # returns the per-pixel threshold map (float32, same size as img)
+    h, w = img.shape
+    rows, cols = -(-h // step), -(-w // step)
+
+    # window (r, c) covers the rows [r*step + step//2, +window) and the columns [c*step + step//2, +window)
+    # of the padded image, so it is centered on the tile center (r + 0.5) * step of the original image
+    pad = window // 2
+    bottom = (rows - 1) * step + step // 2 + window - pad - h
+    right = (cols - 1) * step + step // 2 + window - pad - w
+    padded = cv.copyMakeBorder(img, pad, max(bottom, 0), pad, max(right, 0), cv.BORDER_REFLECT_101)
+
+    # strips between consecutive window edges
+    x0 = np.arange(cols) * step + step // 2
+    edges = np.unique(np.concatenate((x0, x0 + window)))
+    num_strips = len(edges) - 1
+    strip_of_column = np.searchsorted(edges, np.arange(padded.shape[1]), side='right') - 1
+    strip_of_column[(strip_of_column < 0) | (strip_of_column >= num_strips)] = num_strips
+    left_edge = np.searchsorted(edges, x0)
+    right_edge = np.searchsorted(edges, x0 + window)
+
+    global_thresh, _ = cv.threshold(img, 0, 255, cv.THRESH_BINARY+cv.THRESH_OTSU)
+    values = np.arange(256)
+    grid = np.empty((rows, cols), np.float32)
+    C = np.zeros((num_strips + 1, 256), np.int64)
+
+    strips = None
+    for r in range(rows):
+        y0 = r * step + step // 2
+        if strips is None or step >= window:
+            strips = strip_histograms(padded[y0:y0+window], strip_of_column, num_strips)
+        else:
+            # slide the band down: add the entering rows, subtract the leaving rows
+            strips += strip_histograms(padded[y0+window-step:y0+window], strip_of_column, num_strips)
+            strips -= strip_histograms(padded[y0-step:y0], strip_of_column, num_strips)
+
+        # slide the windows right: every window of the band at once
+        np.cumsum(strips, axis=0, out=C[1:])
+        hists = C[right_edge] - C[left_edge]
+
+        thresh = otsu_thresholds(hists).astype(np.float32)
+
+        # flat windows: use the global threshold
+        n = window * window
+        mean = hists @ values / n
+        std = np.sqrt(np.maximum(hists @ (values * values) / n - mean * mean, 0))
+        thresh[std < min_std] = global_thresh
+
+        grid[r] = thresh
+
+    # bilinear interpolation between the tile centers: with INTER_LINEAR, cv.resize puts the value of
+    # grid cell (r, c) exactly at the pixel ((c + 0.5) * step, (r + 0.5) * step), which is the center of its window
+    return cv.resize(grid, (cols * step, rows * step), interpolation=cv.INTER_LINEAR)[:h, :w]
+
+def local_otsu(img, step=32, window=64, min_std=8.0):
+    # same output convention as cv.threshold with THRESH_BINARY: 255 where the pixel is above its threshold
+    thresh = local_otsu_threshold(img, step, window, min_std)
+    return np.where(img > thresh, 255, 0).astype(np.uint8)
+
+
+img = cv.imread('dave.jpg', 0)
+img = cv.medianBlur(img, 5)
+
+ret,th1 = cv.threshold(img, 0, 255, cv.THRESH_BINARY+cv.THRESH_OTSU)
+th2 = cv.adaptiveThreshold(img, 255, cv.ADAPTIVE_THRESH_GAUSSIAN_C, cv.THRESH_BINARY, 11, 2)
+th3 = local_otsu(img, step=16, window=32)
+
+titles = ['Original Image', "Global Otsu's Thresholding",
+            'Adaptive Gaussian Thresholding', "Local Otsu's Thresholding"]
+images = [img, th1, th2, th3]
+
 for i in range(4):
     plt.subplot(2,2,i+1), plt.imshow(images[i], 'gray')
     plt.title(titles[i])
@@ -2,6 +2,8 @@ import cv2 as cv
 import numpy as np
 from matplotlib import pyplot as plt
 
+from otsu import otsu_thresholds
+
 ## Otsu’s Binarization
 
 """
@@ -43,4 +45,154 @@ for i in range(3):
     plt.title(titles[i*3+1]), plt.xticks([]), plt.yticks([])
     plt.subplot(3,3,i*3+3),plt.imshow(images[i*3+2],'gray')
     plt.title(titles[i*3+2]), plt.xticks([]), plt.yticks([])
-plt.show()
\ No newline at end of file
+plt.show()
+
+
+## Multi-level Otsu
+
+"""
+Otsu's method is not limited to two classes. For an image with K classes (e.g. background, part and shadow) we look for K-1 thresholds
+t1 < t2 < ... which maximize the between-class variance. Class c holds the values in (t[c-1], t[c]], the same convention as cv.threshold,
+where the pixels above the threshold go to the upper class.
+
+Trying all the K-tuples of thresholds is O(256^(K-1)), so instead:
+    - The between-class variance is, up to constants, the sum over the classes of M_c^2 / W_c,
+      where W_c is the number of pixels in the class and M_c the sum of their values.
+    - With prefix sums of the histogram (W) and of i * histogram (M), the score of any class made of the bins [i, j) is
+      (M[j] - M[i])^2 / (W[j] - W[i]), so all 257x257 scores are one numpy expression.
+    - Then dynamic programming: best[k][j] is the best score of the bins [0, j) split into k classes,
+      best[k][j] = max over i of best[k-1][i] + score(i, j). Every step is a (257, 257) numpy max, so the whole search is O(K * 256^2).
+Finally a 256-entry lookup table maps every gray value to its class, and cv.LUT turns the image into a label image in one pass.
+"""
+
+def multi_otsu_thresholds(hist, classes=3):
+    # returns the classes-1 thresholds, in increasing order
+    hist = np.asarray(hist, np.float64).ravel()
+    W = np.concatenate(([0.0], np.cumsum(hist)))
+    M = np.concatenate(([0.0], np.cumsum(hist * np.arange(256))))
+
+    # score[i, j] of the class made of the bins [i, j), only i < j is a valid class
+    dw = W[None, :] - W[:, None]
+    dm = M[None, :] - M[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = np.where(dw > 0, dm * dm / dw, 0.0)
+    score[np.tril_indices(257)] = -np.inf
+
+    best = score[0]  # best[j]: bins [0, j) in one class
+    choices = []
+    for k in range(1, classes):
+        total = best[:, None] + score     # total[i, j]: bins [0, i) in k classes, then the class [i, j)
+        choices.append(np.argmax(total, axis=0))
+        best = total[choices[-1], np.arange(257)]
+
+    # walk back from the full range [0, 256) to find where every class starts
+    thresholds = []
+    j = 256
+    for choice in reversed(choices):
+        j = choice[j]
+        thresholds.append(int(j) - 1) # last bin of the lower class
+    return thresholds[::-1]
+
+def multi_otsu_lut(thresholds, spread=False):
+    # lut[v] = class of the gray value v, optionally spread over 0..255 to display the labels
+    lut = np.searchsorted(thresholds, np.arange(256), side='left').astype(np.uint8)
+    if spread:
+        lut *= 255 // len(thresholds)
+    return lut
+
+def multi_otsu(img, classes=3, spread=False):
+    hist = cv.calcHist([img], [0], None, [256], [0,256])
+    thresholds = multi_otsu_thresholds(hist, classes)
+    return thresholds, cv.LUT(img, multi_otsu_lut(thresholds, spread))
+
+
+thresholds, labels = multi_otsu(blur, classes=3, spread=True)
+print("3-class Otsu thresholds:", thresholds)
+
+# with 2 classes it is the usual Otsu's threshold
+print("2-class Otsu threshold:", multi_otsu_thresholds(cv.calcHist([blur], [0], None, [256], [0,256]), 2), ret3)
+
+plt.subplot(1,2,1),plt.imshow(blur,'gray')
+plt.title('Gaussian filtered Image'), plt.xticks([]), plt.yticks([])
+plt.subplot(1,2,2),plt.imshow(labels,'gray')
+plt.title('3-class Otsu'), plt.xticks([]), plt.yticks([])
+plt.show()
+
+# time it on a 1080p frame
+frame = cv.resize(blur, (1920,1080))
+e1 = cv.getTickCount()
+thresholds, labels = multi_otsu(frame, classes=3)
+e2 = cv.getTickCount()
+print("1080p, 3 classes: %f ms" % (1000 * (e2 - e1) / cv.getTickFrequency()))
+
+
+
+## Otsu's thresholding on video
+
+"""
+In a video, applying cv.THRESH_OTSU on every frame rebuilds the histogram from scratch each time,
+and the threshold jumps a little from frame to frame because of the noise, so the binary output flickers.
+
+StreamingOtsu keeps one histogram for the whole stream instead:
+    - every new frame is blended into it with an exponential decay: hist = (1 - alpha) * hist + alpha * frame_hist,
+      so the old frames fade out slowly and the noise of a single frame is averaged out.
+    - the threshold is recomputed only when the histogram has drifted away from the one used for the current threshold
+      by more than `tolerance` (L1 distance between the normalized histograms, 0 = identical, 2 = disjoint).
+    - optionally the frame histogram is computed on a subsampled grid (every `subsample`-th pixel in both directions),
+      which divides its cost by subsample^2 and hardly changes the histogram of a natural image.
+"""
+
+class StreamingOtsu:
+    def __init__(self, alpha=0.1, tolerance=0.05, subsample=1):
+        self.alpha = alpha
+        self.tolerance = tolerance
+        self.subsample = subsample
+        self.hist = None       # decayed, normalized histogram of the stream
+        self.ref_hist = None   # histogram used to compute the current threshold
+        self.thresh = 0
+        self.frames = 0
+        self.recomputed = 0
+
+    def update(self, gray):
+        # feed a grayscale frame, returns the current threshold
+        s = self.subsample
+        sample = gray[::s, ::s] if s > 1 else gray
+        hist = np.bincount(sample.ravel(), minlength=256) / float(sample.size)
+
+        if self.hist is None:
+            self.hist = hist
+        else:
+            self.hist *= 1.0 - self.alpha
+            self.hist += self.alpha * hist
+        self.frames += 1
+
+        if self.ref_hist is None or np.abs(self.hist - self.ref_hist).sum() > self.tolerance:
+            self.thresh = otsu_thresholds(self.hist)
+            self.ref_hist = self.hist.copy()
+            self.recomputed += 1
+        return self.thresh
+
+    def apply(self, gray, maxval=255):
+        # same as cv.threshold(gray, 0, maxval, cv.THRESH_BINARY+cv.THRESH_OTSU), with the stream threshold
+        return cv.threshold(gray, self.update(gray), maxval, cv.THRESH_BINARY)
+
+
+cap = cv.VideoCapture('bird.avi')
+otsu = StreamingOtsu(alpha=0.1, tolerance=0.05, subsample=2)
+
+while(cap.isOpened()):
+    ret, frame = cap.read()
+    if ret == False:
+        break
+
+    gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+    thresh, binary = otsu.apply(gray)
+
+    cv.imshow('frame', binary)
+    if cv.waitKey(25) & 0xFF == ord('q'):
+        break
+
+cap.release()
+cv.destroyAllWindows()
+
+print("threshold recomputed on %d of %d frames" % (otsu.recomputed, otsu.frames))
\ No newline at end of file
@@ -0,0 +1,297 @@
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import cv2 as cv
+
+# Command-line benchmark suite for the operations used in these scripts.
+# It replaces the %timeit cells of "Measuring Performance in IPython.ipynb" with numbers we can keep and compare.
+#
+# Usage:
+#     python benchmark_suite.py --output results.json
+#     python benchmark_suite.py --baseline results.json --output new.json
+#     python benchmark_suite.py --ops cvtColor_gray medianBlur --sizes 640x480 1920x1080
+#
+# Every operation runs on synthetic images (same seed, so same content on every run) for every size from 320x240 to 8K.
+# For each (operation, size) we collect --repeat samples, every sample being the mean of enough calls to last --min-time.
+# With --baseline, each result is compared with the stored one using a Mann-Whitney U test on the samples:
+# an operation is flagged as a regression only if its median is slower by more than --threshold AND the difference is significant (p < --alpha).
+# The exit code is 1 when there is at least one regression, so it can be used in a CI job.
+
+SIZES = ['320x240', '640x480', '1280x720', '1920x1080', '3840x2160', '7680x4320']
+
+
+######## Synthetic images ########
+
+def make_image(width, height, seed=0):
+    # smooth gradients plus noise, so that codecs, thresholds and filters see something close to a photo
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    img = np.empty((height, width, 3), np.uint8)
+    noise = rng.normal(0, 12, (height, width)).astype(np.float32)
+    img[:,:,0] = np.clip(0.5 * x + 0.5 * y + noise, 0, 255)
+    img[:,:,1] = np.clip(255 - 0.7 * x + 0.3 * y + noise, 0, 255)
+    img[:,:,2] = np.clip(128 + 100 * np.sin(x / 40) * np.cos(y / 40) + noise, 0, 255)
+    return img
+
+
+######## Operations ########
+
+# Every setup function receives the synthetic image and returns a function with no arguments to time.
+# The work that is not part of the measured operation (conversions, matrices, files to read) is done in setup.
+
+def setup_imread(img, tmpdir):
+    path = os.path.join(tmpdir, 'bench_%dx%d.jpg' % (img.shape[1], img.shape[0]))
+    cv.imwrite(path, img)
+    return lambda: cv.imread(path, cv.IMREAD_COLOR)
+
+def setup_imwrite(img, tmpdir):
+    path = os.path.join(tmpdir, 'bench_out.jpg')
+    return lambda: cv.imwrite(path, img)
+
+def setup_split(img, tmpdir):
+    return lambda: cv.split(img)
+
+def setup_merge(img, tmpdir):
+    channels = cv.split(img)
+    return lambda: cv.merge(channels)
+
+def setup_cvtColor_gray(img, tmpdir):
+    return lambda: cv.cvtColor(img, cv.COLOR_BGR2GRAY)
+
+def setup_cvtColor_hsv(img, tmpdir):
+    return lambda: cv.cvtColor(img, cv.COLOR_BGR2HSV)
+
+def setup_inRange(img, tmpdir):
+    hsv = cv.cvtColor(img, cv.COLOR_BGR2HSV)
+    lower = np.array([110,50,50])
+    upper = np.array([130,255,255])
+    return lambda: cv.inRange(hsv, lower, upper)
+
+def setup_threshold(img, tmpdir):
+    gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
+    return lambda: cv.threshold(gray, 127, 255, cv.THRESH_BINARY)
+
+def setup_threshold_otsu(img, tmpdir):
+    gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
+    return lambda: cv.threshold(gray, 0, 255, cv.THRESH_BINARY+cv.THRESH_OTSU)
+
+def setup_warpAffine(img, tmpdir):
+    rows, cols = img.shape[:2]
+    M = cv.getRotationMatrix2D((cols/2,rows/2), 30, 1)
+    return lambda: cv.warpAffine(img, M, (cols,rows))
+
+def setup_warpPerspective(img, tmpdir):
+    rows, cols = img.shape[:2]
+    pts1 = np.float32([[0,0],[cols,0],[0,rows],[cols,rows]])
+    pts2 = np.float32([[cols*0.1,rows*0.1],[cols*0.9,0],[0,rows],[cols,rows*0.9]])
+    M = cv.getPerspectiveTransform(pts1, pts2)
+    return lambda: cv.warpPerspective(img, M, (cols,rows))
+
+def setup_resize_down(img, tmpdir):
+    return lambda: cv.resize(img, None, fx=0.5, fy=0.5, interpolation=cv.INTER_AREA)
+
+def setup_resize_up(img, tmpdir):
+    return lambda: cv.resize(img, None, fx=2, fy=2, interpolation=cv.INTER_CUBIC)
+
+def setup_filter2D(img, tmpdir):
+    kernel = np.ones((5,5), np.float32) / 25
+    return lambda: cv.filter2D(img, -1, kernel)
+
+def setup_medianBlur(img, tmpdir):
+    return lambda: cv.medianBlur(img, 5)
+
+# the two comparisons of the notebook
+def setup_countNonZero(img, tmpdir):
+    gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
+    return lambda: cv.countNonZero(gray)
+
+def setup_np_count_nonzero(img, tmpdir):
+    gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
+    return lambda: np.count_nonzero(gray)
+
+OPERATIONS = {
+    'imread': setup_imread,
+    'imwrite': setup_imwrite,
+    'split': setup_split,
+    'merge': setup_merge,
+    'cvtColor_gray': setup_cvtColor_gray,
+    'cvtColor_hsv': setup_cvtColor_hsv,
+    'inRange': setup_inRange,
+    'threshold': setup_threshold,
+    'threshold_otsu': setup_threshold_otsu,
+    'warpAffine': setup_warpAffine,
+    'warpPerspective': setup_warpPerspective,
+    'resize_down': setup_resize_down,
+    'resize_up': setup_resize_up,
+    'filter2D': setup_filter2D,
+    'medianBlur': setup_medianBlur,
+    'countNonZero': setup_countNonZero,
+    'np_count_nonzero': setup_np_count_nonzero,
+}
+
+
+######## Timing ########
+
+def calibrate(func, min_time):
+    # like timeit's autorange: number of calls so that one sample lasts at least min_time
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for i in range(number):
+            func()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time:
+            return number
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+
+def measure(func, repeat, min_time):
+    # returns a list of `repeat` samples, each one is the mean time of one call in seconds
+    func() # warm up (allocations, lazy initialization, caches)
+    number = calibrate(func, min_time)
+    samples = []
+    for r in range(repeat):
+        t0 = time.perf_counter()
+        for i in range(number):
+            func()
+        samples.append((time.perf_counter() - t0) / number)
+    return samples
+
+def environment():
+    return {
+        'opencv': cv.__version__,
+        'numpy': np.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'opencv_threads': cv.getNumThreads(),
+        'opencv_optimized': cv.useOptimized(),
+    }
+
+def run(ops, sizes, repeat, min_time):
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in sizes:
+            width, height = [int(v) for v in size.split('x')]
+            img = make_image(width, height)
+            for name in ops:
+                func = OPERATIONS[name](img, tmpdir)
+                samples = measure(func, repeat, min_time)
+                result = {
+                    'op': name,
+                    'size': size,
+                    'samples': samples,
+                    'median': statistics.median(samples),
+                    'mean': statistics.mean(samples),
+                    'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+                    'min': min(samples),
+                }
+                results.append(result)
+                print("%-18s %-10s median %10.3f ms  (min %.3f ms, stdev %.3f ms)" % (
+                    name, size, 1000 * result['median'], 1000 * result['min'], 1000 * result['stdev']))
+    return results
+
+
+######## Comparing with a baseline ########
+
+def mann_whitney_p(a, b):
+    # two-sided p-value of the Mann-Whitney U test, normal approximation with tie correction
+    # (no scipy needed, it is accurate enough from ~8 samples per side)
+    n1, n2 = len(a), len(b)
+    values = sorted([(v, 0) for v in a] + [(v, 1) for v in b])
+    ranks = [0.0] * len(values)
+    ties = 0.0
+    i = 0
+    while i < len(values):
+        j = i
+        while j + 1 < len(values) and values[j + 1][0] == values[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2.0 + 1
+        t = j - i + 1
+        ties += t ** 3 - t
+        i = j + 1
+    r1 = sum(r for r, (v, group) in zip(ranks, values) if group == 0)
+    u = r1 - n1 * (n1 + 1) / 2.0
+    n = n1 + n2
+    mu = n1 * n2 / 2.0
+    sigma = math.sqrt(n1 * n2 / 12.0 * ((n + 1) - ties / (n * (n - 1))))
+    if sigma == 0:
+        return 1.0
+    z = (abs(u - mu) - 0.5) / sigma # with continuity correction
+    return math.erfc(max(z, 0) / math.sqrt(2))
+
+def compare(results, baseline, threshold, alpha):
+    # returns the list of regressions, and prints a line for every (operation, size) found in both runs
+    old = {(r['op'], r['size']): r for r in baseline['results']}
+    regressions = []
+    print()
+    print("%-18s %-10s %10s %10s %8s %8s" % ('operation', 'size', 'base ms', 'new ms', 'change', 'p'))
+    for r in results:
+        b = old.get((r['op'], r['size']))
+        if b is None:
+            continue
+        change = r['median'] / b['median'] - 1
+        p = mann_whitney_p(r['samples'], b['samples'])
+        flag = ''
+        if p < alpha and change > threshold:
+            flag = 'REGRESSION'
+            regressions.append({'op': r['op'], 'size': r['size'], 'change': change, 'p': p})
+        elif p < alpha and change < -threshold:
+            flag = 'faster'
+        print("%-18s %-10s %10.3f %10.3f %+7.1f%% %8.4f %s" % (
+            r['op'], r['size'], 1000 * b['median'], 1000 * r['median'], 100 * change, p, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the OpenCV operations used in these scripts.')
+    parser.add_argument('--ops', nargs='+', choices=sorted(OPERATIONS), default=list(OPERATIONS),
+                        help='operations to run (default: all)')
+    parser.add_argument('--sizes', nargs='+', default=SIZES,
+                        help='image sizes as WIDTHxHEIGHT (default: 320x240 up to 8K)')
+    parser.add_argument('--repeat', type=int, default=10, help='samples per operation and size')
+    parser.add_argument('--min-time', type=float, default=0.05, help='minimum duration of one sample in seconds')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare with the results stored in this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.05,
+                        help='relative slowdown of the median that counts as a regression (default: 0.05)')
+    parser.add_argument('--alpha', type=float, default=0.01, help='significance level of the test (default: 0.01)')
+    args = parser.parse_args(argv)
+
+    env = environment()
+    print("OpenCV %s, NumPy %s, %d threads" % (env['opencv'], env['numpy'], env['opencv_threads']))
+
+    results = run(args.ops, args.sizes, args.repeat, args.min_time)
+    data = {'environment': env, 'repeat': args.repeat, 'min_time': args.min_time, 'results': results}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['environment'] != env:
+            print("\nWarning: the baseline was recorded in a different environment:")
+            for key in sorted(env):
+                if baseline['environment'].get(key) != env[key]:
+                    print("    %s: %s -> %s" % (key, baseline['environment'].get(key), env[key]))
+        regressions = compare(results, baseline, args.threshold, args.alpha)
+        print("\n%d regression(s)" % len(regressions))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import cv2 as cv
+
+# Reading and writing many images with a pool of threads.
+#
+# cv.imread and cv.imwrite release the GIL while they decode and encode, so threads are enough to use all the cores,
+# and the images don't have to be copied between processes like with multiprocessing.
+#
+#     for path, img in BulkReader(list_images('photos'), prefetch=32):
+#         ...                                  # img is None when the file can't be read
+#
+#     with BulkWriter() as writer:
+#         writer.write('out/0001.png', img)   # returns at once, the encoding happens in the pool
+#
+# BulkReader decodes up to `prefetch` images ahead of the loop, and gives them back in the order of the paths
+# (ordered=True) or as soon as they are decoded (ordered=False). The decoded images waiting for the loop, plus
+# the ones being decoded (estimated from the average size so far), are kept under `max_bytes`:
+# when the loop is slower than the decoding, the reader stops starting new reads instead of filling the memory.
+# BulkWriter keeps the images being encoded under `max_bytes` the same way, write() waits when it's full.
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+
+
+def list_images(directory, extensions=IMAGE_EXTENSIONS, recursive=False):
+    # sorted paths of the images of a directory
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(extensions))
+        if not recursive:
+            break
+    return sorted(paths)
+
+
+class BulkReader:
+    def __init__(self, paths, flags=cv.IMREAD_COLOR, workers=None, prefetch=16, max_bytes=512 * 1024 * 1024, ordered=True):
+        self.paths = paths
+        self.flags = flags
+        self.workers = workers or os.cpu_count()
+        self.prefetch = prefetch
+        self.max_bytes = max_bytes
+        self.ordered = ordered
+        self.count = 0        # images given to the loop, and their total size
+        self.total_bytes = 0
+
+    def read(self, path):
+        return path, cv.imread(path, self.flags)
+
+    def pending_bytes(self, pending):
+        # decoded images not given to the loop yet, plus an estimate for the ones still being decoded
+        # (the average size of the images decoded so far; until the first one is known, one read per worker)
+        done_bytes, done, running = 0, 0, 0
+        for future in pending:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                img = future.result()[1]
+                done_bytes += img.nbytes if img is not None else 0
+                done += 1
+            else:
+                running += 1
+        if self.count + done == 0:
+            return self.max_bytes if running >= self.workers else 0
+        return done_bytes + running * (self.total_bytes + done_bytes) // (self.count + done)
+
+    def __iter__(self):
+        paths = iter(self.paths)
+        pending = deque()
+        exhausted = False
+        pool = ThreadPoolExecutor(self.workers)
+        try:
+            while True:
+                # start new reads while there is room (always at least one, whatever its size)
+                while not exhausted and len(pending) < self.prefetch and (not pending or self.pending_bytes(pending) < self.max_bytes):
+                    path = next(paths, None)
+                    if path is None:
+                        exhausted = True
+                    else:
+                        pending.append(pool.submit(self.read, path))
+                if not pending:
+                    break
+
+                if self.ordered:
+                    future = pending.popleft()
+                else:
+                    done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+                    future = next(f for f in pending if f in done)
+                    pending.remove(future)
+
+                path, img = future.result()
+                self.count += 1
+                self.total_bytes += img.nbytes if img is not None else 0
+                yield path, img
+        finally:
+            # the loop can stop early: don't start the reads that are still waiting
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=True)
+
+
+class BulkWriter:
+    def __init__(self, workers=None, max_pending=64, max_bytes=512 * 1024 * 1024):
+        self.pool = ThreadPoolExecutor(workers or os.cpu_count())
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes
+        self.pending = deque() # (future, nbytes)
+        self.pending_bytes = 0
+        self.failed = []
+
+    def collect(self, block):
+        # remove the finished writes, and wait for the oldest one when block is True
+        while self.pending and (block or self.pending[0][0].done()):
+            future, nbytes = self.pending.popleft()
+            path, ok = future.result()
+            self.pending_bytes -= nbytes
+            if not ok:
+                self.failed.append(path)
+            block = False
+
+    def encode(self, path, img, params):
+        # runs in the pool: a write that raises (e.g. cv2.error for an unknown extension) is a failed write
+        try:
+            return path, cv.imwrite(path, img, params)
+        except cv.error:
+            return path, False
+
+    def write(self, path, img, params=()):
+        # same as cv.imwrite(path, img, params), done in the pool. Don't modify img afterwards, it's encoded later.
+        self.collect(False)
+        while self.pending and (len(self.pending) >= self.max_pending or self.pending_bytes + img.nbytes > self.max_bytes):
+            self.collect(True)
+        future = self.pool.submit(self.encode, path, img, list(params))
+        self.pending.append((future, img.nbytes))
+        self.pending_bytes += img.nbytes
+
+    def close(self):
+        # waits for all the writes, returns the paths that could not be written
+        try:
+            while self.pending:
+                self.collect(True)
+        finally:
+            self.pool.shutdown(wait=True)
+        return self.failed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
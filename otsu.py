@@ -0,0 +1,78 @@
+import numpy as np
+
+# Otsu's threshold of many histograms at once, with the same result as cv.THRESH_OTSU
+# (see 19_image_thresholding_otsu_implementation.py for how it works, and 17_image_thresholding.py for local Otsu).
+#
+# With p the normalized histogram and t a candidate threshold (first class = bins 0..t), the threshold maximizes
+# the between-class variance (mu * q1(t) - m1(t))^2 / (q1(t) * (1 - q1(t))), where q1 and m1 are cumulative sums:
+# all 256 candidates of all the histograms of a (N, 256) stack are evaluated in one numpy expression.
+
+FLT_EPSILON = float(np.finfo(np.float32).eps)
+
+def otsu_thresholds_sequential(hists):
+    # The exact computation order of cv.THRESH_OTSU, vectorized over the images but not over the bins.
+    # Only needed to break exact ties (e.g. a histogram with 3 equal peaks) the same way OpenCV does.
+    hists = np.asarray(hists, np.float64)
+    scale = 1.0 / hists.sum(axis=1)
+    mu = (hists @ np.arange(256, dtype=np.float64)) * scale
+    mu1 = np.zeros(len(hists))
+    q1 = np.zeros(len(hists))
+    max_sigma = np.zeros(len(hists))
+    max_val = np.zeros(len(hists), np.int64)
+    for i in range(256):
+        p_i = hists[:, i] * scale
+        mu1 *= q1
+        q1 += p_i
+        q2 = 1.0 - q1
+        valid = (np.minimum(q1, q2) >= FLT_EPSILON) & (np.maximum(q1, q2) <= 1.0 - FLT_EPSILON)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            new_mu1 = (mu1 + i * p_i) / q1
+            mu2 = (mu - q1 * new_mu1) / q2
+            sigma = q1 * q2 * (mu2 - new_mu1) ** 2
+        mu1 = np.where(valid, new_mu1, mu1)
+        better = valid & (sigma > max_sigma)
+        max_sigma = np.where(better, sigma, max_sigma)
+        max_val[better] = i
+    return max_val
+
+def otsu_thresholds(hists):
+    # hists: one histogram (256,) or a stack (N, 256), returns the threshold(s) cv.THRESH_OTSU would find
+    hists = np.asarray(hists)
+    single = hists.ndim == 1
+    hists = hists.reshape(-1, 256)
+
+    # work on the counts instead of the probabilities: it multiplies the variance by n^2 for every t,
+    # which doesn't move the maximum and saves the normalization pass
+    w1 = np.cumsum(hists, axis=1, dtype=np.float64)
+    m1 = np.cumsum(hists * np.arange(256), axis=1, dtype=np.float64)
+    n = w1[:, -1:]
+    w2 = n - w1
+
+    sigma = w1 * m1[:, -1:]
+    sigma -= n * m1
+    sigma *= sigma
+
+    # like OpenCV, ignore the candidates where one of the classes is (almost) empty
+    eps = FLT_EPSILON * n
+    valid = (w1 >= eps) & (w2 >= eps)
+    np.divide(sigma, w1 * w2, out=sigma, where=valid)
+    sigma[~valid] = 0
+    thresh = np.argmax(sigma, axis=1)
+
+    # when two candidates are equal up to rounding errors, the winner depends on the order of the float operations,
+    # so those (rare) rows are recomputed in OpenCV's order to return exactly the same value
+    best = sigma[np.arange(len(sigma)), thresh][:, None]
+    ties = np.count_nonzero(sigma >= best * (1 - 1e-9), axis=1) > 1
+    ties &= best[:, 0] > 0
+    if ties.any():
+        thresh[ties] = otsu_thresholds_sequential(hists[ties])
+
+    return int(thresh[0]) if single else thresh
+
+def histograms(images):
+    # 256-bin histograms of a stack of uint8 images (N, H, W) in one np.bincount call:
+    # image k uses the bins [256*k, 256*k + 256)
+    n = len(images)
+    flat = images.reshape(n, -1).astype(np.intp) + 256 * np.arange(n)[:, None]
+    return np.bincount(flat.ravel(), minlength=256 * n).reshape(n, 256)
+
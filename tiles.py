@@ -0,0 +1,217 @@
+import argparse
+import math
+import sys
+import multiprocessing as mp
+from functools import partial
+
+import numpy as np
+import cv2 as cv
+
+# Tiled processing of images too large for memory (e.g. 50000x50000 slide scans).
+#
+# Usage:
+#     python tiles.py scan.npy scan_median.npy --op median --ksize 5 --max-memory 512
+#     python tiles.py scan.npy scan_bin.npy --op adaptive --block-size 51 --c 2 --workers 8
+#
+# The image is a .npy file opened as a memory map (np.load(..., mmap_mode='r')), so only the pixels of the tiles
+# being processed are read from disk, and the result is written into another memory-mapped .npy file.
+#
+# A filter needs the neighbours of a pixel: a k x k kernel reads k//2 pixels on each side (its footprint).
+# So every tile is read with a halo of that many extra pixels around it, the operator runs on the tile + halo,
+# and only the center of the result (the tile itself) is written: the tiles fit together without seams.
+# Where the halo falls outside of the image, it's made with cv.copyMakeBorder and the chosen border type, exactly
+# like the operator would do it on the whole image (see "Making Borders for Images" in 11_basic_operations.py).
+# BORDER_WRAP needs pixels from the other side of the image, not from the tile, so it's done by index instead.
+#
+# The tiles are processed by a pool of worker processes. Every worker opens the input and output memory maps
+# itself, so only the tile coordinates go through the pool. The tile size is chosen from --max-memory:
+# a worker holds about 4 copies of a tile + halo at the same time (padded input, operator temporaries, output).
+# Note: the memory maps also fill the page cache, but the system can drop those pages whenever it needs the memory.
+
+MEMORY_FACTOR = 4
+
+
+######## Operators ########
+
+# An operator is a function applied to a padded tile, with the halo it needs.
+# The functions are module-level (with functools.partial) so that they can be sent to the worker processes.
+
+class Operator:
+    def __init__(self, func, halo, border=cv.BORDER_REFLECT_101):
+        self.func = func
+        self.halo = halo
+        self.border = border # border used by the OpenCV function on a whole image
+
+def apply_filter2d(tile, kernel, ddepth):
+    return cv.filter2D(tile, ddepth, kernel)
+
+def apply_median(tile, ksize):
+    return cv.medianBlur(tile, ksize)
+
+def apply_gaussian(tile, ksize, sigma):
+    return cv.GaussianBlur(tile, (ksize, ksize), sigma)
+
+def apply_adaptive_threshold(tile, maxValue, method, thresholdType, blockSize, C):
+    return cv.adaptiveThreshold(tile, maxValue, method, thresholdType, blockSize, C)
+
+def filter2d_op(kernel, ddepth=-1):
+    return Operator(partial(apply_filter2d, kernel=kernel, ddepth=ddepth), max(kernel.shape[:2]) // 2)
+
+def median_op(ksize):
+    # cv.medianBlur replicates the border pixels
+    return Operator(partial(apply_median, ksize=ksize), ksize // 2, cv.BORDER_REPLICATE)
+
+def gaussian_op(ksize, sigma=0):
+    # with ksize <= 0, cv.GaussianBlur computes the kernel size from sigma: round(sigma * 6 + 1) | 1 for uint8 images,
+    # round(sigma * 8 + 1) | 1 for the other types. The halo uses the larger one, whatever the type of the image.
+    if ksize <= 0:
+        if sigma <= 0:
+            raise ValueError("gaussian_op needs a positive ksize or a positive sigma")
+        ksize = int(round(sigma * 8 + 1)) | 1
+        return Operator(partial(apply_gaussian, ksize=0, sigma=sigma), ksize // 2)
+    return Operator(partial(apply_gaussian, ksize=ksize, sigma=sigma), ksize // 2)
+
+def adaptive_threshold_op(maxValue, method, thresholdType, blockSize, C):
+    # the local mean (or gaussian) is computed over blockSize x blockSize, with replicated borders
+    func = partial(apply_adaptive_threshold, maxValue=maxValue, method=method, thresholdType=thresholdType,
+                   blockSize=blockSize, C=C)
+    return Operator(func, blockSize // 2, cv.BORDER_REPLICATE)
+
+
+######## Tiles ########
+
+def tile_size_for(shape, itemsize, halo, max_memory, workers):
+    # largest tile side (multiple of 64) such that all the workers together stay under max_memory bytes
+    channels = shape[2] if len(shape) == 3 else 1
+    per_worker = max_memory / workers / (MEMORY_FACTOR * channels * itemsize)
+    side = (int(math.sqrt(per_worker)) - 2 * halo) // 64 * 64
+    if side < max(64, halo + 1):
+        raise ValueError("max_memory is too small for %d workers with a halo of %d pixels" % (workers, halo))
+    return side
+
+def tile_rects(shape, tile_size):
+    rows, cols = shape[:2]
+    return [(x, y, min(x + tile_size, cols), min(y + tile_size, rows))
+            for y in range(0, rows, tile_size) for x in range(0, cols, tile_size)]
+
+def read_tile(src, rect, halo, border, value=0):
+    # the tile (x0, y0, x1, y1) of src with `halo` more pixels on every side
+    x0, y0, x1, y1 = rect
+    rows, cols = src.shape[:2]
+    if border == cv.BORDER_WRAP:
+        ys = np.arange(y0 - halo, y1 + halo) % rows
+        xs = np.arange(x0 - halo, x1 + halo) % cols
+        return np.ascontiguousarray(src[ys[:, None], xs])
+
+    # read what's inside the image, and make the rest with copyMakeBorder
+    top, left = max(y0 - halo, 0), max(x0 - halo, 0)
+    bottom, right = min(y1 + halo, rows), min(x1 + halo, cols)
+    tile = np.ascontiguousarray(src[top:bottom, left:right])
+    pad = (top - (y0 - halo), (y1 + halo) - bottom, left - (x0 - halo), (x1 + halo) - right)
+    if any(pad):
+        tile = cv.copyMakeBorder(tile, *pad, border, value=value)
+    return tile
+
+def process_tile(src, dst, op, rect, border, value):
+    x0, y0, x1, y1 = rect
+    h = op.halo
+    out = op.func(read_tile(src, rect, h, border, value))
+    dst[y0:y1, x0:x1] = out[h:h + y1 - y0, h:h + x1 - x0]
+
+
+######## Worker processes ########
+
+worker = {}
+
+def init_worker(src_path, dst_path, op, border, value):
+    worker['src'] = np.load(src_path, mmap_mode='r')
+    worker['dst'] = np.load(dst_path, mmap_mode='r+')
+    worker['args'] = (op, border, value)
+
+def run_tile(rect):
+    op, border, value = worker['args']
+    process_tile(worker['src'], worker['dst'], op, rect, border, value)
+    return rect
+
+def output_like(src, op, border, value):
+    # dtype and number of channels of the result, found by running the operator on a small tile
+    size = 2 * op.halo + 8
+    probe = op.func(read_tile(src, (0, 0, min(size, src.shape[1]), min(size, src.shape[0])), op.halo, border, value))
+    return probe.dtype, src.shape[:2] + probe.shape[2:]
+
+def process_tiled(src, dst, op, border=None, value=0, tile_size=None, workers=None, max_memory=256 * 1024 * 1024):
+    # src: path of a .npy image (opened as a memory map) or an array
+    # dst: path of the .npy file to create, or None to return the result as an array (only for arrays that fit in memory)
+    # border: cv.BORDER_* used where the halo is outside of the image (default: the one of the operator)
+    # workers: number of worker processes, 1 processes the tiles in this process (the only option when src is an array)
+    if border is None:
+        border = op.border
+    src_path = src if isinstance(src, str) else None
+    if src_path is not None:
+        src = np.load(src_path, mmap_mode='r')
+    if workers is None:
+        workers = mp.cpu_count() if src_path is not None and dst is not None else 1
+    if workers > 1 and (src_path is None or dst is None):
+        raise ValueError("worker processes need the input and the output as .npy files")
+    if tile_size is None:
+        tile_size = tile_size_for(src.shape, src.itemsize, op.halo, max_memory, workers)
+    if tile_size <= op.halo:
+        raise ValueError("tiles of %d pixels are too small for a halo of %d pixels" % (tile_size, op.halo))
+
+    dtype, shape = output_like(src, op, border, value)
+    if dst is None:
+        out = np.empty(shape, dtype)
+    else:
+        out = np.lib.format.open_memmap(dst, mode='w+', dtype=dtype, shape=shape)
+    rects = tile_rects(src.shape, tile_size)
+
+    if workers == 1:
+        for rect in rects:
+            process_tile(src, out, op, rect, border, value)
+    else:
+        out.flush()
+        with mp.Pool(workers, init_worker, (src_path, dst, op, border, value)) as pool:
+            for rect in pool.imap_unordered(run_tile, rects):
+                pass
+    if dst is not None:
+        out.flush()
+    return out
+
+
+BORDERS = {'constant': cv.BORDER_CONSTANT, 'replicate': cv.BORDER_REPLICATE, 'reflect': cv.BORDER_REFLECT,
+           'reflect101': cv.BORDER_REFLECT_101, 'wrap': cv.BORDER_WRAP}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Filter a .npy image that does not fit in memory, tile by tile.')
+    parser.add_argument('src', help='input image (.npy)')
+    parser.add_argument('dst', help='output image (.npy)')
+    parser.add_argument('--op', choices=['median', 'gaussian', 'box', 'adaptive'], default='median')
+    parser.add_argument('--ksize', type=int, default=5, help='aperture of median, gaussian and box filters')
+    parser.add_argument('--block-size', type=int, default=11, help='block size of the adaptive threshold')
+    parser.add_argument('--c', type=float, default=2, help='constant of the adaptive threshold')
+    parser.add_argument('--border', choices=sorted(BORDERS), help='border type (default: the one of the operator)')
+    parser.add_argument('--tile-size', type=int, help='tile side in pixels (default: from --max-memory)')
+    parser.add_argument('--workers', type=int, help='worker processes (default: number of cores)')
+    parser.add_argument('--max-memory', type=float, default=256, help='memory for all the tiles in MB (default: 256)')
+    args = parser.parse_args(argv)
+
+    if args.op == 'median':
+        op = median_op(args.ksize)
+    elif args.op == 'gaussian':
+        op = gaussian_op(args.ksize)
+    elif args.op == 'box':
+        op = filter2d_op(np.ones((args.ksize, args.ksize), np.float32) / (args.ksize * args.ksize))
+    else:
+        op = adaptive_threshold_op(255, cv.ADAPTIVE_THRESH_MEAN_C, cv.THRESH_BINARY, args.block_size, args.c)
+
+    border = BORDERS[args.border] if args.border else None
+    e1 = cv.getTickCount()
+    out = process_tiled(args.src, args.dst, op, border, tile_size=args.tile_size, workers=args.workers,
+                        max_memory=int(args.max_memory * 1024 * 1024))
+    e2 = cv.getTickCount()
+    print("Wrote %s (%dx%d) in %f seconds" % (args.dst, out.shape[1], out.shape[0], (e2 - e1) / cv.getTickFrequency()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
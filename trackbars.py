@@ -0,0 +1,32 @@
+import cv2 as cv
+
+# Trackbars that don't redraw on every event (10_trackbar_as_a_color_palette.py, 15_changing_colorspaces.py).
+#
+# The simplest loop calls cv.imshow and reads the trackbars every millisecond (cv.waitKey(1)), even when nothing moved,
+# so an idle window keeps a whole core busy. Instead, TrackbarPanel keeps the trackbar values and a "dirty" flag:
+# 	- the trackbar callbacks only store the new position and set the flag, they don't redraw anything.
+# 	- refresh() waits for events for one display refresh (cv.waitKey(delay) sleeps in the GUI event loop, it doesn't spin),
+# 	  then calls redraw() once if the flag is set. A burst of trackbar events between two refreshes gives a single redraw.
+# 	- redraw() should update the image in place (img[:] = ...) instead of allocating a new one.
+
+class TrackbarPanel:
+    def __init__(self, window):
+        self.window = window
+        self.values = {}
+        self.dirty = True # draw once at the start
+
+    def add(self, name, value, maxval):
+        self.values[name] = value
+        cv.createTrackbar(name, self.window, value, maxval, lambda pos, name=name: self.changed(name, pos))
+
+    def changed(self, name, pos):
+        self.values[name] = pos
+        self.dirty = True
+
+    def refresh(self, redraw, delay=30):
+        # returns the key pressed during the wait, like cv.waitKey
+        k = cv.waitKey(delay) & 0xFF
+        if self.dirty:
+            self.dirty = False
+            redraw(self.values)
+        return k
@@ -0,0 +1,193 @@
+import argparse
+import os
+import sys
+import multiprocessing as mp
+
+import cv2 as cv
+
+from bulk_io import IMAGE_EXTENSIONS
+
+# Puts a logo / watermark on images and videos.
+# It's the logo example of 12_arithmetic_operations.py, reorganized for many frames.
+#
+# Usage:
+#     python watermark.py opencv_logo.png photos/ out/
+#     python watermark.py opencv_logo.png clip.avi out.avi --corner bottom-right --opacity 0.5
+#
+# The example in 12 computes the gray image, the threshold, the inverse mask and two bitwise_and of the logo,
+# and allocates five temporary images for one overlay. Most of that only depends on the logo, so Overlay does it
+# once, and apply() composites the logo directly into the ROI of the frame:
+#   - opaque logos (every pixel of the mask is 0 or 255): one cv.copyTo() of the logo through its mask.
+#   - transparent logos (alpha channel, or opacity < 1): roi = roi * (255 - alpha) / 255 + premultiplied logo,
+#     with cv.multiply and cv.add on uint8, where the premultiplied logo (logo * alpha / 255) is computed once.
+#
+# A directory of images is processed by a pool of worker processes: every worker reads, watermarks and writes
+# its own files, so no image goes through the pool. Grayscale images get a gray logo and BGRA images keep
+# their alpha channel, other images (16 bits, ...) are reported as failed.
+# A video is watermarked in the main process: apply() only touches the ROI of the logo and costs much less
+# than decoding and encoding the frame, sending full frames to workers and back would cost more than it saves.
+
+CORNERS = ['top-left', 'top-right', 'bottom-left', 'bottom-right']
+
+
+class Overlay:
+    def __init__(self, sprite, threshold=10, opacity=1.0):
+        # sprite: BGRA image with its own alpha channel,
+        # or BGR image on a black background (pixels with gray value <= threshold are transparent)
+        if sprite.shape[2] == 4:
+            alpha = sprite[:,:,3].copy()
+            sprite = sprite[:,:,:3]
+        else:
+            gray = cv.cvtColor(sprite, cv.COLOR_BGR2GRAY)
+            ret, alpha = cv.threshold(gray, threshold, 255, cv.THRESH_BINARY)
+        if opacity < 1:
+            alpha = cv.convertScaleAbs(alpha, alpha=opacity)
+
+        self.shape = sprite.shape
+        self.opaque = cv.countNonZero(cv.inRange(alpha, 1, 254)) == 0
+        self.mask = alpha
+        if self.opaque:
+            self.foreground = cv.bitwise_and(sprite, sprite, mask=alpha)
+        else:
+            alpha3 = cv.merge([alpha] * 3)
+            self.foreground = cv.multiply(sprite, alpha3, scale=1/255)
+            self.inverse = cv.bitwise_not(alpha3)
+
+    def position(self, frame, corner='top-right', margin=0):
+        # top-left corner (x, y) of the logo in the frame
+        rows, cols = frame.shape[:2]
+        h, w = self.shape[:2]
+        x = margin if corner.endswith('left') else cols - w - margin
+        y = margin if corner.startswith('top') else rows - h - margin
+        return x, y
+
+    def apply(self, frame, x, y):
+        # composites the logo in place with its top-left corner at (x, y), the part outside of the frame is cut
+        rows, cols = frame.shape[:2]
+        h, w = self.shape[:2]
+        sx0, sy0 = max(-x, 0), max(-y, 0)
+        sx1, sy1 = min(w, cols - x), min(h, rows - y)
+        if sx0 >= sx1 or sy0 >= sy1:
+            return frame
+
+        roi = frame[y+sy0:y+sy1, x+sx0:x+sx1]
+        if self.opaque:
+            cv.copyTo(self.foreground[sy0:sy1, sx0:sx1], self.mask[sy0:sy1, sx0:sx1], roi)
+        else:
+            cv.multiply(roi, self.inverse[sy0:sy1, sx0:sx1], dst=roi, scale=1/255)
+            cv.add(roi, self.foreground[sy0:sy1, sx0:sx1], dst=roi)
+        return frame
+
+
+######## Batch mode ########
+
+# every worker process builds its own Overlay once, in init_worker()
+worker = {}
+
+def init_worker(sprite, threshold, opacity, corner, margin):
+    worker['overlay'] = Overlay(sprite, threshold, opacity)
+    worker['corner'] = corner
+    worker['margin'] = margin
+
+def watermark_frame(frame):
+    overlay = worker['overlay']
+    x, y = overlay.position(frame, worker['corner'], worker['margin'])
+    return overlay.apply(frame, x, y)
+
+def watermark_image(img):
+    # returns the watermarked image with the same channels as img, or None for images we can't handle
+    if img.dtype != 'uint8':
+        return None
+    if img.ndim == 2:
+        bgr = watermark_frame(cv.cvtColor(img, cv.COLOR_GRAY2BGR))
+        return cv.cvtColor(bgr, cv.COLOR_BGR2GRAY)
+    if img.shape[2] == 4:
+        # the logo goes on the color channels, the alpha channel of the image is kept as it is
+        img[:,:,:3] = watermark_frame(cv.cvtColor(img, cv.COLOR_BGRA2BGR))
+        return img
+    if img.shape[2] == 3:
+        return watermark_frame(img)
+    return None
+
+def watermark_file(paths):
+    src, dst = paths
+    img = cv.imread(src, cv.IMREAD_UNCHANGED)
+    if img is None:
+        return src, False
+    img = watermark_image(img)
+    if img is None:
+        return src, False
+    return src, cv.imwrite(dst, img)
+
+def watermark_directory(sprite, src_dir, dst_dir, corner='top-right', margin=0, threshold=10, opacity=1.0, workers=None):
+    # watermarks every image of src_dir into dst_dir (same file names), returns the list of files that failed
+    os.makedirs(dst_dir, exist_ok=True)
+    names = sorted(n for n in os.listdir(src_dir) if n.lower().endswith(IMAGE_EXTENSIONS))
+    jobs = [(os.path.join(src_dir, n), os.path.join(dst_dir, n)) for n in names]
+    failed = []
+    with mp.Pool(workers, init_worker, (sprite, threshold, opacity, corner, margin)) as pool:
+        for src, ok in pool.imap_unordered(watermark_file, jobs, chunksize=4):
+            if not ok:
+                failed.append(src)
+    return failed
+
+def watermark_video(sprite, src, dst, corner='top-right', margin=0, threshold=10, opacity=1.0, fourcc='XVID'):
+    # returns the number of frames written
+    cap = cv.VideoCapture(src)
+    if not cap.isOpened():
+        raise IOError("could not open %s" % src)
+    fps = cap.get(cv.CAP_PROP_FPS) or 25
+    size = (int(cap.get(cv.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv.CAP_PROP_FRAME_HEIGHT)))
+    out = cv.VideoWriter(dst, cv.VideoWriter_fourcc(*fourcc), fps, size)
+
+    overlay = Overlay(sprite, threshold, opacity)
+    count = 0
+    while True:
+        ret, frame = cap.read()
+        if ret == False:
+            break
+        x, y = overlay.position(frame, corner, margin)
+        out.write(overlay.apply(frame, x, y))
+        count += 1
+
+    cap.release()
+    out.release()
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Put a logo on every image of a directory or every frame of a video.')
+    parser.add_argument('logo', help='logo image (BGRA with alpha, or BGR on a black background)')
+    parser.add_argument('src', help='directory of images or video file')
+    parser.add_argument('dst', help='output directory or video file')
+    parser.add_argument('--corner', choices=CORNERS, default='top-right')
+    parser.add_argument('--margin', type=int, default=0, help='distance to the corner in pixels')
+    parser.add_argument('--threshold', type=int, default=10,
+                        help='for BGR logos: gray value under which the logo is transparent (default: 10)')
+    parser.add_argument('--opacity', type=float, default=1.0)
+    parser.add_argument('--workers', type=int, help='worker processes for a directory (default: number of cores)')
+    args = parser.parse_args(argv)
+
+    sprite = cv.imread(args.logo, cv.IMREAD_UNCHANGED)
+    if sprite is None or sprite.ndim != 3:
+        print("could not read the logo %s" % args.logo)
+        return 1
+
+    options = dict(corner=args.corner, margin=args.margin, threshold=args.threshold, opacity=args.opacity)
+    e1 = cv.getTickCount()
+    if os.path.isdir(args.src):
+        failed = watermark_directory(sprite, args.src, args.dst, workers=args.workers, **options)
+        for src in failed:
+            print("failed: %s" % src)
+        result = "%s" % args.dst
+    else:
+        count = watermark_video(sprite, args.src, args.dst, **options)
+        failed = []
+        result = "%d frames to %s" % (count, args.dst)
+    e2 = cv.getTickCount()
+    print("Wrote %s in %f seconds" % (result, (e2 - e1) / cv.getTickFrequency()))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())